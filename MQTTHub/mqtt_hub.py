@@ -0,0 +1,477 @@
+"""
+MQTT hub  —  one broker connection shared by every controller on this PC.
+
+    python mqtt_hub.py            (settings in HubConfig.ini next to this file)
+
+The controller scripts talk to the hub over a localhost TCP socket instead of
+opening their own paho client, keepalive and network thread each.  Set
+
+    [MQTT]
+    hub = 127.0.0.1:1885
+
+in TempConfig.ini / MotionConfig.ini and their MQTTManager gets a HubClient,
+which has the part of the paho Client API those managers use.
+
+Protocol: one JSON object per line.
+    app -> hub   {"op": "hello", "client_id": ..., "will": {topic, payload, retain}}
+                 {"op": "pub", "topic": ..., "payload": ..., "qos": 0, "retain": false}
+                 {"op": "sub", "topic": ...}          {"op": "bye"}
+    hub -> app   {"op": "state", "connected": true}
+                 {"op": "msg", "topic": ..., "payload": ...}
+Binary payloads travel as {"b64": "..."} in place of the payload string.
+
+Per app the hub keeps the last will (published when the app's socket drops
+without "bye"), the last retained message per topic (replayed after a broker
+outage) and, while the broker is away, a bounded queue of everything else.
+Non-retained messages on the coalesce_topics filters are rate-limited to
+max_rate_hz (last value wins).  List only topics whose every message is a
+full state; history batches, spool drains, delta frames and binary samples
+must each arrive, so everything else passes straight through.
+
+A broker connection carries only one last will, and the hub's own is its
+status_topic.  So that an app's will (e.g. the LongHistory availability
+topic) still fires when the hub process itself dies, the hub registers it as
+the LWT of a small extra connection per app with a will; that connection
+sends nothing and is closed cleanly when the app detaches.  A hub that is
+stopped normally publishes the wills of the apps still attached.
+"""
+import base64
+import configparser
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+
+HUB_DEFAULT_PORT = 1885
+
+
+def _encode_payload(payload):
+    if isinstance(payload, (bytes, bytearray)):
+        return {"b64": base64.b64encode(bytes(payload)).decode("ascii")}
+    return payload
+
+
+def _decode_payload(payload):
+    if isinstance(payload, dict) and "b64" in payload:
+        return base64.b64decode(payload["b64"])
+    return payload
+
+
+def _send_line(sock, lock, obj):
+    data = (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+    with lock:
+        sock.sendall(data)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  App side: paho-compatible client
+# ─────────────────────────────────────────────────────────────────────────────
+class _Info:
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class _Message:
+    def __init__(self, topic, payload):
+        self.topic   = topic
+        self.payload = payload if isinstance(payload, bytes) else str(payload).encode("utf-8")
+        self.qos     = 0
+        self.retain  = False
+
+
+class HubClient:
+    """
+    Stand-in for paho.mqtt.client.Client that forwards to a local MQTTHub.
+    Broker host/port given to connect_async() are ignored (the hub owns the
+    broker settings); callbacks fire on this client's reader thread, with
+    on_connect/on_disconnect following the hub's broker state.
+    """
+    MQTT_ERR_SUCCESS = 0
+    MQTT_ERR_NO_CONN = 4
+
+    def __init__(self, hub, client_id="", **_):
+        host, _, port = str(hub).rpartition(":")
+        self.hub_addr  = (host or "127.0.0.1", int(port or HUB_DEFAULT_PORT))
+        self.client_id = client_id or f"hubclient_{os.getpid()}"
+        self.on_connect = self.on_message = self.on_disconnect = self.on_connect_fail = None
+        self._will      = None
+        self._subs      = []
+        self._sock      = None
+        self._wlock     = threading.Lock()
+        self._broker_up = False
+        self._stop      = threading.Event()
+        self._thread    = None
+        self._min_delay, self._max_delay = 1, 60
+
+    # ---- paho API subset -------------------------------------------------
+    def username_pw_set(self, username, password=None):
+        pass                                        # credentials live in the hub
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        self._will = {"topic": topic, "payload": _encode_payload(payload), "retain": bool(retain)}
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        self._min_delay, self._max_delay = max(1, min_delay), max(1, max_delay)
+
+    def connect_async(self, host=None, port=None, keepalive=60, **_):
+        pass
+
+    def loop_start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name=f"hub-{self.client_id}")
+            self._thread.start()
+
+    def loop_stop(self, force=False):
+        self._stop.set()
+
+    def disconnect(self):
+        self._stop.set()
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                _send_line(sock, self._wlock, {"op": "bye"})
+                sock.close()
+            except OSError:
+                pass
+
+    def is_connected(self):
+        return self._sock is not None and self._broker_up
+
+    def subscribe(self, topic, qos=0):
+        if topic not in self._subs:
+            self._subs.append(topic)
+        return self._send({"op": "sub", "topic": topic}), None
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        return _Info(self._send({"op": "pub", "topic": topic, "payload": _encode_payload(payload),
+                                 "qos": int(qos), "retain": bool(retain)}))
+
+    # ---- socket ----------------------------------------------------------
+    def _send(self, obj):
+        sock = self._sock
+        if sock is None:
+            return self.MQTT_ERR_NO_CONN
+        try:
+            _send_line(sock, self._wlock, obj)
+            return self.MQTT_ERR_SUCCESS
+        except OSError:
+            return self.MQTT_ERR_NO_CONN
+
+    def _fire(self, name, *args):
+        fn = getattr(self, name)
+        if fn is not None:
+            try:
+                fn(self, None, *args)
+            except Exception as e:
+                print(f"[HUB] {name} callback error: {e}")
+
+    def _run(self):
+        delay = self._min_delay
+        while not self._stop.is_set():
+            try:
+                sock = socket.create_connection(self.hub_addr, timeout=5)
+            except OSError:
+                self._fire("on_connect_fail")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self._max_delay)
+                continue
+            delay = self._min_delay
+            sock.settimeout(None)
+            self._sock = sock
+            try:
+                _send_line(sock, self._wlock, {"op": "hello", "client_id": self.client_id,
+                                               "will": self._will})
+                for topic in self._subs:
+                    self._send({"op": "sub", "topic": topic})
+                for line in sock.makefile("r", encoding="utf-8"):
+                    self._handle(json.loads(line))
+            except (OSError, ValueError):
+                pass
+            self._sock = None
+            if self._broker_up:
+                self._broker_up = False
+                self._fire("on_disconnect", 1)
+            if not self._stop.is_set():
+                self._stop.wait(delay)
+
+    def _handle(self, obj):
+        op = obj.get("op")
+        if op == "state":
+            up = bool(obj.get("connected"))
+            if up != self._broker_up:
+                self._broker_up = up
+                if up:
+                    self._fire("on_connect", {}, 0)
+                else:
+                    self._fire("on_disconnect", 1)
+        elif op == "msg":
+            self._fire("on_message", _Message(obj["topic"], _decode_payload(obj.get("payload"))))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Hub side
+# ─────────────────────────────────────────────────────────────────────────────
+class _AppConn:
+    def __init__(self, sock):
+        self.sock      = sock
+        self.lock      = threading.Lock()
+        self.client_id = "?"
+        self.will      = None
+        self.will_client = None                     # holds `will` as a broker LWT
+        self.subs      = set()
+        self.clean     = False                      # True after "bye"
+
+    def send(self, obj):
+        try:
+            _send_line(self.sock, self.lock, obj)
+        except OSError:
+            pass
+
+
+class MQTTHub:
+    """Owns the broker connection and fans messages in from / out to the apps."""
+
+    def __init__(self, cfg):
+        import paho.mqtt.client as mqtt
+        self._mqtt = mqtt
+        self._topic_matches = mqtt.topic_matches_sub
+        b, h = cfg["Broker"], cfg["Hub"]
+        self._broker = b
+        self._reconnect = (max(1, h.getint("reconnect_min_s", 1)), max(1, h.getint("reconnect_max_s", 60)))
+        self.listen      = (h.get("listen_host", "127.0.0.1"), h.getint("listen_port", HUB_DEFAULT_PORT))
+        self.interval    = 1.0 / h.getfloat("max_rate_hz", 0) if h.getfloat("max_rate_hz", 0) > 0 else 0.0
+        self.coalesce    = [t.strip() for t in h.get("coalesce_topics", "").split(",") if t.strip()]
+        self._coalesce_hit = {}                     # topic -> matches a coalesce filter
+        self.status_topic = h.get("status_topic", "").strip()
+        self.apps        = set()
+        self.retained    = {}                       # topic -> (payload, qos), replayed on reconnect
+        self.backlog     = deque(maxlen=h.getint("queue_max", 1000))
+        self.broker_subs = set()
+        self.connected   = False
+        self.sent = self.coalesced = self.dropped = 0
+        self._lock    = threading.Lock()
+        self._cv      = threading.Condition(self._lock)
+        self._pending = {}                          # topic -> (payload, qos), rate-limited
+        self._last    = {}
+
+        self.client_id = b.get("client_id", "") or f"MQTTHub_{os.getpid()}"
+        self.client = self._broker_client(self.client_id)
+        if self.status_topic:
+            self.client.will_set(self.status_topic, "offline", retain=True)
+        self.client.on_connect    = self._on_connect
+        self.client.on_disconnect = lambda c, u, *a: self._lost()
+        self.client.on_message    = self._on_message
+        threading.Thread(target=self._rate_loop, daemon=True, name="hub-rate").start()
+
+    # ---- broker ----------------------------------------------------------
+    def _broker_client(self, client_id):
+        c = self._mqtt.Client(client_id=client_id, clean_session=True)
+        if self._broker.get("username", ""):
+            c.username_pw_set(self._broker["username"], self._broker.get("password", "") or None)
+        c.reconnect_delay_set(min_delay=self._reconnect[0], max_delay=self._reconnect[1])
+        return c
+
+    def _connect(self, client):
+        b = self._broker
+        client.connect_async(b["host"], b.getint("port", 1883), keepalive=b.getint("keepalive", 60))
+        client.loop_start()
+
+    def _hold_will(self, app):
+        """Register app.will as the LWT of its own (otherwise idle) connection."""
+        w = app.will
+        c = self._broker_client(f"{self.client_id}_will_{id(app):x}")
+        c.will_set(w["topic"], _decode_payload(w.get("payload")), retain=bool(w.get("retain")))
+        self._connect(c)
+        app.will_client = c
+
+    def _release_will(self, app):
+        c, app.will_client = app.will_client, None
+        if c is not None:
+            c.disconnect()                          # clean: the broker drops the LWT
+            c.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, rc, *_):
+        if rc != 0:
+            print(f"[HUB] broker rc={rc}")
+            return
+        if self.status_topic:
+            client.publish(self.status_topic, "online", retain=True)
+        with self._lock:
+            self.connected = True                   # new publishes go straight out
+            subs, retained = set(self.broker_subs), dict(self.retained)
+            backlog = list(self.backlog)
+            self.backlog.clear()
+        for topic in subs:
+            client.subscribe(topic)
+        for topic, (payload, qos) in retained.items():
+            client.publish(topic, payload, qos=qos, retain=True)
+        for topic, payload, qos in backlog:
+            client.publish(topic, payload, qos=qos, retain=False)
+        print(f"[HUB] broker connected; replayed {len(retained)} retained, {len(backlog)} queued")
+        self._tell_apps()
+
+    def _lost(self):
+        with self._lock:
+            if not self.connected:
+                return
+            self.connected = False
+        print("[HUB] broker disconnected")
+        self._tell_apps()
+
+    def _tell_apps(self):
+        for app in list(self.apps):
+            app.send({"op": "state", "connected": self.connected})
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            payload = msg.payload.decode("utf-8")
+        except UnicodeDecodeError:
+            payload = _encode_payload(msg.payload)
+        for app in list(self.apps):
+            if any(self._topic_matches(sub, msg.topic) for sub in app.subs):
+                app.send({"op": "msg", "topic": msg.topic, "payload": payload})
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        payload = _decode_payload(payload)
+        with self._lock:
+            if retain:
+                self.retained[topic] = (payload, qos)
+            if not self.connected:
+                if not retain:
+                    if len(self.backlog) == self.backlog.maxlen:
+                        self.dropped += 1
+                    self.backlog.append((topic, payload, qos))
+                return
+            if not retain and self.interval and self._coalescable(topic):
+                now = time.monotonic()
+                if topic in self._pending or now - self._last.get(topic, float("-inf")) < self.interval:
+                    if topic in self._pending:
+                        self.coalesced += 1
+                    self._pending[topic] = (payload, qos)
+                    self._cv.notify()
+                    return
+                self._last[topic] = now
+            self.sent += 1
+        self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def _coalescable(self, topic):
+        hit = self._coalesce_hit.get(topic)
+        if hit is None:
+            hit = self._coalesce_hit[topic] = any(self._topic_matches(f, topic) for f in self.coalesce)
+        return hit
+
+    def _rate_loop(self):
+        while True:
+            with self._cv:
+                while not self._pending:
+                    self._cv.wait()
+                now = time.monotonic()
+                due = [t for t in self._pending if now - self._last.get(t, float("-inf")) >= self.interval]
+                if not due:
+                    self._cv.wait(min(self._last[t] for t in self._pending) + self.interval - now)
+                    continue
+                batch = [(t,) + self._pending.pop(t) for t in due]
+                for t in due:
+                    self._last[t] = now
+                self.sent += len(batch)
+            for topic, payload, qos in batch:
+                self.client.publish(topic, payload, qos=qos, retain=False)
+
+    def subscribe(self, topic):
+        with self._lock:
+            new = topic not in self.broker_subs
+            self.broker_subs.add(topic)
+        if new and self.connected:
+            self.client.subscribe(topic)
+
+    # ---- apps ------------------------------------------------------------
+    def serve_app(self, sock):
+        app = _AppConn(sock)
+        self.apps.add(app)
+        try:
+            for line in sock.makefile("r", encoding="utf-8"):
+                try:
+                    obj = json.loads(line)
+                    op = obj.get("op")
+                    if op in ("pub", "sub") and not isinstance(obj["topic"], str):
+                        raise TypeError("topic must be a string")
+                    if op == "hello" and obj.get("will") is not None \
+                            and not isinstance(obj["will"].get("topic"), str):
+                        raise TypeError("will topic must be a string")
+                    qos = int(obj.get("qos", 0))
+                except (ValueError, AttributeError, KeyError, TypeError):
+                    print(f"[HUB] {app.client_id}: bad line ignored")
+                    continue
+                if op == "pub":
+                    self.publish(obj["topic"], obj.get("payload"), qos, bool(obj.get("retain")))
+                elif op == "sub":
+                    app.subs.add(obj["topic"])
+                    self.subscribe(obj["topic"])
+                elif op == "hello":
+                    app.client_id, app.will = obj.get("client_id") or "?", obj.get("will")
+                    self._release_will(app)
+                    if app.will:
+                        self._hold_will(app)
+                    print(f"[HUB] {app.client_id} attached ({len(self.apps)} apps)")
+                    app.send({"op": "state", "connected": self.connected})
+                elif op == "bye":
+                    app.clean = True
+                    break
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[HUB] {app.client_id}: {e}")
+        finally:
+            self.apps.discard(app)
+            if app.will and not app.clean:          # same meaning as a broker LWT
+                self._publish_will(app)
+            self._release_will(app)
+            print(f"[HUB] {app.client_id} detached")
+
+    def _publish_will(self, app):
+        w = app.will
+        self.publish(w["topic"], w.get("payload"), 0, bool(w.get("retain")))
+
+    def serve_forever(self):
+        hub = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                hub.serve_app(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer(self.listen, Handler)
+        server.daemon_threads = True
+        self._connect(self.client)
+        print(f"[HUB] listening on {self.listen[0]}:{self.listen[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            for app in list(self.apps):             # they lose the broker with us
+                if app.will:
+                    self._publish_will(app)
+                self._release_will(app)
+            if self.status_topic:
+                self.client.publish(self.status_topic, "offline", retain=True)
+            self.client.loop_stop()
+            self.client.disconnect()
+            print(f"[HUB] sent {self.sent}, coalesced {self.coalesced}, dropped {self.dropped}")
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "HubConfig.ini")
+    cfg = configparser.ConfigParser()
+    if not cfg.read(path, encoding="utf-8"):
+        raise FileNotFoundError(f"[Config] Cannot read {path}")
+    MQTTHub(cfg).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
 # ─────────────────────────────────────────────────────────────────────────────
 #  Imports & constants
 # ─────────────────────────────────────────────────────────────────────────────
-import os, sys, time, csv, threading, datetime
+import os, sys, time, csv, math, threading, datetime, uuid, hashlib, hmac, queue, subprocess
 import clr, System
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from flask import Flask, jsonify
+from flask import Flask, Response, request
 import keyboard
 import configparser
 import paho.mqtt.client as mqtt
 import json
+from bisect import bisect_left
+from collections import deque
 
 
 
@@ -51,9 +53,136 @@ POP_FONT     = ("Arial", 10)
 ICON_PATH = cfg.get("UI", "icon_path", fallback="")
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+#  Metrics  (Prometheus text format at /metrics)
+# ─────────────────────────────────────────────────────────────────────────────
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    """Monotonic counter; inc() is a single in-place add, no lock."""
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self):
+        yield self.name, self.value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram.  observe() is a bisect plus two in-place adds
+    and takes no lock; under the GIL a collision can at worst lose one
+    observation, which is fine for monitoring.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets):
+        self.name, self.help = name, help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, v):
+        self._counts[bisect_left(self.buckets, v)] += 1
+        self._sum += v
+
+    def samples(self):
+        acc = 0
+        for le, n in zip(self.buckets, self._counts):
+            acc += n
+            yield f'{self.name}_bucket{{le="{le}"}}', acc
+        acc += self._counts[-1]
+        yield f'{self.name}_bucket{{le="+Inf"}}', acc
+        yield f"{self.name}_sum", round(self._sum, 6)
+        yield f"{self.name}_count", acc
+
+
+class Gauge:
+    """Value read at scrape time through `fn` – zero cost on the hot path."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        self.name, self.help, self.fn = name, help_text, fn
+
+    def samples(self):
+        try:
+            v = self.fn()
+        except Exception:
+            v = None
+        if v is not None:
+            yield self.name, v
+
+
+class MetricsRegistry:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._items = []
+
+    def _add(self, m):
+        self._items.append(m)
+        return m
+
+    def counter(self, name, help_text):
+        return self._add(Counter(self.prefix + name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, buckets))
+
+    def gauge(self, name, help_text, fn):
+        return self._add(Gauge(self.prefix + name, help_text, fn))
+
+    def render(self):
+        out = []
+        for m in self._items:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(f"{k} {float(v)!r}" for k, v in m.samples())
+        return "\n".join(out) + "\n"
+
+
+metrics = MetricsRegistry("onway_motion_")
+M_DLL_CALLS   = metrics.counter("dll_calls_total", "Controller DLL commands checked with _ok()")
+M_DLL_FAIL    = metrics.counter("dll_failures_total", "Controller DLL commands that did not return FUNRES_OK")
+M_READ_AXIS   = metrics.histogram("dll_read_axis_seconds", "read_axis() latency (position; parameters only on refresh)")
+M_PARAM_DRIFT = metrics.counter("param_cache_mismatch_total", "Cached velocity/acceleration that differed from the controller")
+M_MOTION_POLL = metrics.histogram("motion_poll_period_seconds", "Tick period of the motion sampler per axis",
+                                  buckets=(0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0))
+M_Z_GUARD     = metrics.histogram("z_guard_period_seconds", "Tick period of the Z jog limit guard (sampler thread)",
+                                  buckets=(0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0))
+M_LOG_WRITE   = metrics.histogram("log_write_seconds", "Time to append one CSV log row (log writer lag)")
+M_MQTT_PUB    = metrics.counter("mqtt_publish_total", "MQTT telemetry publishes")
+M_MQTT_FAIL   = metrics.counter("mqtt_publish_failures_total", "MQTT publishes rejected by the client")
+M_MQTT_COALESCED = metrics.counter("mqtt_publish_coalesced_total", "Telemetry updates replaced before they were sent")
+for _k in ('r_position','z_position','r_velocity','z_velocity','r_acceleration','z_acceleration'):
+    metrics.gauge(_k, f"Last known {_k.replace('_', ' ')}", lambda k=_k: api_state[k])
+metrics.gauge("ws_clients", "Connected WebSocket position clients", lambda: len(ws_stream.clients))
+metrics.gauge("keys_suspended", "1 while keyboard control is suspended for motion", lambda: int(KEYS_SUSPENDED))
+
 clr.AddReference(DLL_PATH)
 from SerialPortLibrary import SPLibClass
-sp = SPLibClass()
+class _SerialisedDLL:
+    """SPLibClass with every call under one lock: the motion sampler thread
+    reads positions while the Tk thread sends commands on the same port."""
+    def __init__(self, lib):
+        self._lib = lib
+        self.lock = threading.RLock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._lib, name)
+        if not callable(attr):
+            return attr
+        def call(*args):
+            with self.lock:
+                return attr(*args)
+        return call
+
+sp = _SerialisedDLL(SPLibClass())
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Tk & REST API bootstrap
@@ -71,9 +200,221 @@ if ICON_PATH and os.path.exists(ICON_PATH):
 app = Flask(__name__)
 api_state = {k: 0.0 for k in ('r_position','z_position','r_velocity','z_velocity',
                               'r_acceleration','z_acceleration')}
+
+class StatusSnapshot:
+    """
+    Latest published api_state as an immutable (seq, body, etag) tuple.
+    update_state() publishes after a change; /api/status serves the
+    pre-encoded bytes and answers unchanged polls with 304.
+    """
+    def __init__(self):
+        self._boot = format(int(time.time()), "x")
+        self._lock = threading.Lock()
+        self.current = (0, b"{}", f'"{self._boot}-0"')
+
+    def publish(self, state):
+        body = json.dumps(dict(state), separators=(",", ":")).encode()
+        with self._lock:
+            seq, old_body, _ = self.current
+            if body != old_body:
+                seq += 1
+                self.current = (seq, body, f'"{self._boot}-{seq}"')
+        return seq
+
+status_snapshot = StatusSnapshot()
+status_snapshot.publish(api_state)
+
+def snapshot_response(snapshot):
+    _, body, etag = snapshot.current
+    tags = [t.strip().removeprefix("W/")
+            for t in request.headers.get("If-None-Match", "").split(",")]
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in tags or "*" in tags:
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+SECRET_TOKEN = cfg.get("Security", "secret_token", fallback="")
+
+def check_token():
+    """Routes that move the stage: Authorization must carry [Security] secret_token."""
+    if not SECRET_TOKEN:
+        return True
+    tok = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    return hmac.compare_digest(tok.encode(), SECRET_TOKEN.encode())
+
 @app.route("/api/status")
-def _(): return jsonify(api_state)
-def start_api(): app.run("0.0.0.0", gi("General","api_port"), debug=False, use_reloader=False)
+def _(): return snapshot_response(status_snapshot)
+
+@app.route("/metrics")
+def _metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ---- WebSocket position stream (own port; asyncio loop in a daemon thread) ----
+WS_PORT   = cfg.getint("API", "ws_port", fallback=gi("General","api_port") + 1)
+WS_MAX_HZ = cfg.getfloat("API", "ws_max_hz", fallback=20.0)
+
+class _WsClient:
+    def __init__(self, ws, max_hz, fields):
+        self.ws      = ws
+        self.pending = {}                 # merged deltas not yet sent
+        self.wake    = None               # asyncio.Event, created on the loop
+        self.configure(max_hz, fields)
+
+    def configure(self, max_hz, fields):
+        self.min_dt = 1.0 / max_hz if max_hz and max_hz > 0 else 0.0
+        self.fields = set(fields) if fields else None
+
+class PositionStream:
+    """
+    Pushes api_state deltas from update_state() to WebSocket clients.
+
+    Clients connect to ws://host:<ws_port>/?max_hz=10&fields=z_position and
+    may later send {"max_hz": .., "fields": [..]}.  Deltas arriving faster
+    than a client's rate cap are merged (latest value wins), so a slow
+    client costs one dict, never a growing queue.
+    """
+    def __init__(self):
+        self.loop    = None
+        self.clients = set()
+        self._stop   = None
+
+    def start(self, port):
+        try:
+            import websockets
+        except ImportError:
+            print("[WS] websockets not installed – position stream disabled")
+            return
+        threading.Thread(target=self._run, args=(websockets, port), daemon=True).start()
+
+    def stop(self):
+        if self.loop and self._stop:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    def push(self, delta):
+        """Thread-safe; called from the Tk thread on every state change."""
+        loop = self.loop
+        if loop is not None and delta and self.clients:
+            loop.call_soon_threadsafe(self._fanout, dict(delta, ts=round(time.time(), 3)))
+
+    # ---- loop thread ----
+    def _run(self, websockets, port):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def main():
+            self._stop = asyncio.Event()
+            async with websockets.serve(self._handler, "0.0.0.0", port):
+                self.loop = loop
+                await self._stop.wait()
+            self.loop = None
+        try:
+            loop.run_until_complete(main())
+        except OSError as e:
+            print(f"[WS] cannot listen on :{port}: {e}")
+
+    def _fanout(self, delta):
+        for c in self.clients:
+            keys = delta.keys() if c.fields is None else c.fields & delta.keys()
+            if keys:
+                c.pending.update((k, delta[k]) for k in keys)
+                c.pending["ts"] = delta["ts"]
+                c.wake.set()
+
+    async def _handler(self, ws, path=None):
+        import asyncio
+        from urllib.parse import urlsplit, parse_qs
+        path = path or getattr(ws, "path", None) or getattr(getattr(ws, "request", None), "path", "/")
+        q = parse_qs(urlsplit(path).query)
+        try:
+            max_hz = float(q.get("max_hz", [WS_MAX_HZ])[0])
+        except ValueError:
+            max_hz = WS_MAX_HZ
+        fields = [f for f in ",".join(q.get("fields", [])).split(",") if f]
+        c = _WsClient(ws, max_hz, fields)
+        c.wake = asyncio.Event()
+
+        # snapshot and registration with no await in between: every delta
+        # after the snapshot lands in c.pending while the snapshot is sent
+        snapshot = json.dumps(dict(api_state, ts=round(time.time(), 3)))
+        self.clients.add(c)
+        sender = None
+        try:
+            await ws.send(snapshot)             # full state first
+            sender = asyncio.ensure_future(self._sender(c))
+            sender.add_done_callback(           # a failed send ends the connection
+                lambda t: t.cancelled() or t.exception() is None or asyncio.ensure_future(ws.close()))
+            async for raw in ws:                # optional live reconfiguration
+                try:
+                    opts = json.loads(raw)
+                    c.configure(float(opts.get("max_hz", 1.0 / c.min_dt if c.min_dt else 0)),
+                                opts.get("fields", c.fields))
+                except (ValueError, TypeError, AttributeError):
+                    await ws.send(json.dumps({"error": "expected {\"max_hz\": n, \"fields\": [..]}"}))
+        except Exception:
+            pass                                # connection closed
+        finally:
+            self.clients.discard(c)
+            if sender is not None:
+                sender.cancel()
+                try:
+                    await sender
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    print(f"[WS] send to client failed: {e}")
+
+    async def _sender(self, c):
+        import asyncio
+        last = 0.0
+        while True:
+            await c.wake.wait()
+            c.wake.clear()
+            wait = last + c.min_dt - asyncio.get_running_loop().time()
+            if wait > 0:
+                await asyncio.sleep(wait)       # rate cap: keep merging meanwhile
+            msg, c.pending = c.pending, {}
+            if msg:
+                await c.ws.send(json.dumps(msg))
+            last = asyncio.get_running_loop().time()
+
+ws_stream = PositionStream()
+
+# ---- API serving  ([API] section; "flask" = development server) ----
+API_SERVER      = cfg.get("API", "server", fallback="waitress").strip().lower()
+API_THREADS     = cfg.getint("API", "threads", fallback=8)
+API_CONN_LIMIT  = cfg.getint("API", "connection_limit", fallback=100)
+API_KEEPALIVE_S = cfg.getint("API", "keepalive_timeout", fallback=120)
+_wsgi_server = None
+
+def start_api():
+    """Serve the Flask app; blocks until stop_api() is called."""
+    global _wsgi_server
+    port = gi("General","api_port")
+    if API_SERVER == "waitress":
+        try:
+            from waitress import create_server
+        except ImportError:
+            print("[API] waitress not installed – using Flask dev server")
+        else:
+            _wsgi_server = create_server(app, host="0.0.0.0", port=port,
+                                         threads=API_THREADS,
+                                         connection_limit=API_CONN_LIMIT,
+                                         channel_timeout=API_KEEPALIVE_S,
+                                         ident="onway-motion")
+            try:
+                _wsgi_server.run()
+            except (OSError, ValueError):
+                pass                            # listener closed by stop_api()
+            return
+    app.run("0.0.0.0", port, debug=False, use_reloader=False, threaded=True)
+
+def stop_api():
+    global _wsgi_server
+    srv, _wsgi_server = _wsgi_server, None
+    if srv is not None:
+        try: srv.close()
+        except Exception as e: print("[API] stop error:", e)
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Widgets & globals
@@ -134,13 +475,20 @@ def log(msg: str):
         os.makedirs(folder, exist_ok=True)     # make sure path exists
 
         new = fn not in written_files
+        t0 = time.perf_counter()
         with open(fn, "a", newline="", encoding=LOG_ENCODING) as f:
             writer = csv.writer(f)
             if new: writer.writerow(["Timestamp", "Message"])
             writer.writerow([stamp, msg])
         written_files.add(fn)
+        M_LOG_WRITE.observe(time.perf_counter() - t0)
 
-def _ok(ret): return ret == sp.FUNRES_OK
+def _ok(ret):
+    M_DLL_CALLS.inc()
+    if ret == sp.FUNRES_OK:
+        return True
+    M_DLL_FAIL.inc()
+    return False
 
 def _clamp_z(val: float) -> float:
     """Keep Z target within [Z_MIN, Z_MAX]."""
@@ -156,15 +504,8 @@ def stop_axis(ax):
     resume()
     _ok(sp.MoCtrCard_StopAxisMov(System.Byte(ax)))
 
-    # cancel any existing "to-target" poll and start a short settle poll
-    if _MOTION_POLL[ax] is not None:
-        try:
-            root.after_cancel(_MOTION_POLL[ax])
-        except Exception:
-            pass
-        _MOTION_POLL[ax] = None
-
-    # Start a no-target settle poll so UI keeps updating while the axis coasts to a stop.
+    # Replace any "to-target" poll with a no-target settle poll so the UI
+    # keeps updating while the axis coasts to a stop.
     # IMPORTANT: do NOT suspend keys for this settle.
     _start_motion_poll(ax, target=None, suspend_keys=False)
 
@@ -174,23 +515,52 @@ def stop_axis(ax):
     log(f"[STOP] {'RZ'[ax]} axis stopped.")
 
 
-def read_axis(ax):
-    def _get(idx):
-        buf = System.Array.CreateInstance(System.Single,1)
-        _ok(sp.MoCtrCard_ReadPara(System.Byte(ax),System.Byte(idx),buf))
-        return buf[0]
-    pos  = _get(0 if ax else 0)      # pos is param 0, but we have separate call:
+# ---- axis parameter cache ----
+#  Velocity (param 2) and acceleration (param 3) only change through
+#  _apply_param, so read_axis() reads the position and serves both from the
+#  values confirmed at SendPara time.  The sampler thread re-reads them from
+#  the controller every PARAM_VERIFY_S while the axis is idle and posts them
+#  to _check_axis_params() on the Tk thread.
+PARAM_VERIFY_S = cfg.getfloat("General", "param_verify_s", fallback=30.0)
+_PARAM_CACHE   = {0: {}, 1: {}}          # ax -> {2: velocity, 3: acceleration}
+_PARAM_GEN     = {0: 0, 1: 0}            # bumped whenever the cache is rewritten
+
+def _read_para(ax, idx):
+    buf = System.Array.CreateInstance(System.Single,1)
+    _ok(sp.MoCtrCard_ReadPara(System.Byte(ax),System.Byte(idx),buf))
+    return buf[0]
+
+def read_axis(ax, *, refresh=False):
+    """(pos, vel, acc); vel/acc come from _PARAM_CACHE unless refresh=True."""
+    t0 = time.perf_counter()
     buf  = System.Array.CreateInstance(System.Single,1)
     _ok(sp.MoCtrCard_GetAxisPos(System.Byte(ax),buf)); pos = buf[0]
-    vel, acc = _get(2), _get(3)
-    return pos, vel, acc
+    cache = _PARAM_CACHE[ax]
+    if refresh or len(cache) < 2:
+        cache[2], cache[3] = _read_para(ax, 2), _read_para(ax, 3)
+    M_READ_AXIS.observe(time.perf_counter() - t0)
+    return pos, cache[2], cache[3]
+
+def _check_axis_params(ax, vel, acc, gen):
+    """Tk side of the slow verify: adopt controller values that drifted."""
+    cache = _PARAM_CACHE[ax]
+    if gen != _PARAM_GEN[ax] or len(cache) < 2:
+        return                                   # cache rewritten since the read
+    for idx, kind, eps, val in ((2, 'velocity', _EPS_VEL, vel), (3, 'acceleration', _EPS_ACC, acc)):
+        if abs(val - cache[idx]) > eps:
+            M_PARAM_DRIFT.inc()
+            log(f"[PARAM] Axis {AXES[ax]['lbl']} {kind} on controller is {val:.3f}, "
+                f"cached {cache[idx]:.3f}; using controller value")
+            cache[idx] = val
+    update_state(ax, vel=cache[2], acc=cache[3], publish=True)
 # ─────────────────────────────────────────────────────────────────────────────
 #  Small modal popup to confirm a new velocity / acceleration
 # ─────────────────────────────────────────────────────────────────────────────
 def _confirm_param_change(ax: int, kind: str, new_val: float):
     """White dialog with black outline + green buttons."""
-    _, cur_vel, cur_acc = read_axis(ax)
-    old_val = cur_vel if kind == 'velocity' else cur_acc
+    old_val = _PARAM_CACHE[ax].get(2 if kind == 'velocity' else 3)   # no DLL read on Tk
+    if old_val is None:                          # not read from this card yet
+        old_val = AXES[ax]['v_def' if kind == 'velocity' else 'a_def']
 
     win = tk.Toplevel(root, bg=WHITE_BG, bd=1, relief="solid")
     win.title("Confirm")
@@ -240,13 +610,16 @@ def _apply_param(ax, kind, val):
     idx = 2 if kind=='velocity' else 3
     stop_axis(ax)
     if _ok(sp.MoCtrCard_SendPara(System.Byte(ax), System.Byte(idx), System.Single(val))):
+        _PARAM_CACHE[ax][idx] = val
+        _PARAM_GEN[ax] += 1
         log(f"[{kind[:3].upper()}] Axis {AXES[ax]['lbl']} => {val:.3f} {AXES[ax][kind[0]+'unit']}")
         if kind == 'velocity':
             update_state(ax, vel=val, publish=True)
         else:
             update_state(ax, acc=val, publish=True)
-    else:
-        log(f"[{kind[:3].upper()}] Axis {AXES[ax]['lbl']} set FAILED")
+        return True
+    log(f"[{kind[:3].upper()}] Axis {AXES[ax]['lbl']} set FAILED")
+    return False
 
 
 def on_enter(event, ax, kind):
@@ -265,62 +638,186 @@ def on_focus(evt, ax, kind, state): edit_flag[(ax,kind)] = state
 #  Motion commands
 # ─────────────────────────────────────────────────────────────────────────────
 # ─────────────────────────────────────────────────────────────────────────────
-#  On-demand motion polling (runs ONLY during active motion)
+#  Motion sampler thread (runs ONLY during active motion / Z jog)
 # ─────────────────────────────────────────────────────────────────────────────
+#  Controller reads, settle detection and the Z soft-limit guard run on one
+#  background thread, so a slow serial reply no longer stalls the Tk loop.
+#  Results go to Tk through MotionSampler.queue and are applied by
+#  _drain_samples(); sp serialises the DLL between the two threads.
 
-_MOTION_POLL = {0: None, 1: None}
-_LAST_POS    = {0: None, 1: None}
-_STILL_COUNT = {0: 0,    1: 0   }
+_SETTLED     = {0: threading.Event(), 1: threading.Event()}   # set while idle
+_TIMED_OUT   = {0: False, 1: False}     # last settle on the axis gave up (MOTION_TO_S)
+for _ev in _SETTLED.values(): _ev.set()
+_SETTLE_HOOKS = []    # fn(ax, pos, timed_out, gen), called on the Tk thread when a poll ends
 
 POS_EPS      = float(cfg.get("General", "pos_eps",          fallback="0.005"))   # to target
 DPOS_EPS     = float(cfg.get("General", "dpos_eps",         fallback="0.0015"))  # per tick delta
 STILL_N      = int(  cfg.get("General", "still_n",          fallback="3"))       # consecutive still ticks
 POLL_MS      = int(  cfg.get("General", "poll_ms",          fallback="50"))      # 20 Hz
 MOTION_TO_S  = float(cfg.get("General", "motion_timeout_s", fallback="30"))
+_LIMIT_EPS   = 0.01
 
-def _poll_until_settled(ax: int, target: float | None, t0: float):
-    try:
-        p, v, a = read_axis(ax)
-    except Exception:
-        p = v = a = None
-
-    # Update GUI/API/MQTT if changed
-    update_state(ax, pos=p, vel=v, acc=a, publish=True)
-
-    done = False
-    if p is not None:
-        if target is not None:
-            # known target (home/abs/rel): close to target, then still for a bit
-            close = abs(p - target) <= POS_EPS
-            if close:
-                if _LAST_POS[ax] is not None and abs(p - _LAST_POS[ax]) <= DPOS_EPS:
-                    _STILL_COUNT[ax] += 1
-                else:
-                    _STILL_COUNT[ax] = 0
+
+class MotionSampler:
+    """
+    Every POLL_MS, while some axis is watched or Z is jogging: read the axis,
+    post ("state", ax, pos, vel, acc), and post ("settled", ax, pos,
+    timed_out, gen) once it is close to target (or just still, target None)
+    for STILL_N ticks.  A Z jog past the soft limit is stopped right here and
+    reported as ("zlimit",).  Every PARAM_VERIFY_S it also re-reads velocity/
+    acceleration of idle axes and posts ("params", ax, vel, acc, param_gen).
+    """
+    def __init__(self):
+        self.queue      = queue.Queue()
+        self.gen        = {0: 0, 1: 0}              # bumped by every watch()
+        self._watch     = {}                        # ax -> settle state
+        self._z_dir     = 0
+        self._verify_at = None                      # monotonic of next param check
+        self._cv        = threading.Condition()
+        self._scheduled = threading.Event()         # a _drain_samples is pending
+        threading.Thread(target=self._run, daemon=True, name="motion-sampler").start()
+
+    # ---- Tk thread --------------------------------------------------------
+    def watch(self, ax, target):
+        with self._cv:
+            self.gen[ax] += 1
+            self._watch[ax] = {"target": target, "t0": time.time(), "last": None,
+                               "still": 0, "tick": None, "gen": self.gen[ax]}
+            self._cv.notify()
+
+    def guard_z(self, direction):
+        with self._cv:
+            self._z_dir = direction
+            self._cv.notify()
+
+    def start_param_verify(self):
+        with self._cv:
+            if self._verify_at is None and PARAM_VERIFY_S > 0:
+                self._verify_at = time.monotonic() + PARAM_VERIFY_S
+                self._cv.notify()
+
+    # ---- sampler thread ---------------------------------------------------
+    def _post(self, item):
+        self.queue.put(item)
+        if not self._scheduled.is_set():
+            self._scheduled.set()
+            root.after_idle(_drain_samples)
+
+    def _settle(self, ax, w, p):
+        now = time.perf_counter()
+        if w["tick"] is not None:
+            M_MOTION_POLL.observe(now - w["tick"])
+        w["tick"] = now
+        if p is not None:
+            # known target (home/abs/rel): close to target, then still for a bit;
+            # unknown target (jog/stop): rely on stillness
+            close = w["target"] is None or abs(p - w["target"]) <= POS_EPS
+            if close and w["last"] is not None and abs(p - w["last"]) <= DPOS_EPS:
+                w["still"] += 1
             else:
-                _STILL_COUNT[ax] = 0
-            done = _STILL_COUNT[ax] >= STILL_N
+                w["still"] = 0
+            w["last"] = p
+        timed_out = (time.time() - w["t0"]) > MOTION_TO_S
+        if timed_out:
+            root.after_idle(log, f"[POLL] Axis {AXES[ax]['lbl']} timed out while waiting to settle")
+        return timed_out or w["still"] >= STILL_N, timed_out
+
+    def _verify_params(self, busy):
+        self._verify_at = time.monotonic() + PARAM_VERIFY_S
+        for ax in AXES:
+            if ax in busy or len(_PARAM_CACHE[ax]) < 2 or not _SETTLED[ax].is_set():
+                continue                             # never add reads to a move
+            gen = _PARAM_GEN[ax]
+            try:
+                vel, acc = _read_para(ax, 2), _read_para(ax, 3)
+            except Exception:
+                continue
+            self._post(("params", ax, vel, acc, gen))
+
+    def _run(self):
+        z_tick = None
+        while True:
+            with self._cv:
+                idle = not self._watch and not self._z_dir
+                if idle:
+                    z_tick = None
+                    self._cv.wait(None if self._verify_at is None
+                                  else max(0.0, self._verify_at - time.monotonic()))
+                else:
+                    self._cv.wait(POLL_MS / 1000.0) # first read POLL_MS after a move starts
+                watch, z_dir = dict(self._watch), self._z_dir
+            if self._verify_at is not None and time.monotonic() >= self._verify_at:
+                self._verify_params(set(watch) | ({1} if z_dir else set()))
+            if idle:
+                continue
+            for ax in sorted(set(watch) | ({1} if z_dir else set())):
+                try:
+                    p, v, a = read_axis(ax)
+                except Exception:
+                    p = v = a = None
+                self._post(("state", ax, p, v, a))
+                w = watch.get(ax)
+                if w is not None:
+                    done, timed_out = self._settle(ax, w, p)
+                    if done:
+                        with self._cv:
+                            if self._watch.get(ax) is w:
+                                del self._watch[ax]
+                        self._post(("settled", ax, w["last"], timed_out, w["gen"]))
+                if ax == 1 and z_dir and p is not None:
+                    now = time.perf_counter()
+                    if z_tick is not None:
+                        M_Z_GUARD.observe(now - z_tick)
+                    z_tick = now
+                    if (z_dir > 0 and p >= Z_MAX - _LIMIT_EPS) or \
+                       (z_dir < 0 and p <= Z_MIN + _LIMIT_EPS):
+                        sp.MoCtrCard_StopAxisMov(System.Byte(1))   # don't wait for Tk
+                        with self._cv:
+                            if self._z_dir == z_dir:
+                                self._z_dir = 0
+                        self._post(("zlimit",))
+
+
+sampler = MotionSampler()
+
+
+def _drain_samples():
+    """Tk side of the sampler: apply the newest state per axis, then events."""
+    sampler._scheduled.clear()
+    latest, events = {}, []
+    while True:
+        try:
+            item = sampler.queue.get_nowait()
+        except queue.Empty:
+            break
+        if item[0] == "state":
+            latest[item[1]] = item[2:]
         else:
-            # unknown target (jog): rely on stillness
-            if _LAST_POS[ax] is not None and abs(p - _LAST_POS[ax]) <= DPOS_EPS:
-                _STILL_COUNT[ax] += 1
-            else:
-                _STILL_COUNT[ax] = 0
-            done = _STILL_COUNT[ax] >= STILL_N
-
-        _LAST_POS[ax] = p
-
-    if (time.time() - t0) > MOTION_TO_S:
-        log(f"[POLL] Axis {AXES[ax]['lbl']} timed out while waiting to settle")
-        done = True
+            events.append(item)
+    for ax, (p, v, a) in latest.items():
+        update_state(ax, pos=p, vel=v, acc=a, publish=True)   # GUI/API/MQTT if changed
+    for ev in events:
+        if ev[0] == "settled":
+            _motion_settled(*ev[1:])
+        elif ev[0] == "zlimit":
+            _stop_jog(1)
+            log("[VEL] Z jog stopped at soft limit")
+        elif ev[0] == "params":
+            _check_axis_params(*ev[1:])
 
-    if not done:
-        _MOTION_POLL[ax] = root.after(POLL_MS, lambda: _poll_until_settled(ax, target, t0))
-        return
 
-    # finished
-    _MOTION_POLL[ax] = None
-    _STILL_COUNT[ax] = 0
+def _motion_settled(ax, pos, timed_out, gen):
+    if gen != sampler.gen[ax]:
+        return                          # a newer move on this axis is being watched
+    _TIMED_OUT[ax] = timed_out
+    _SETTLED[ax].set()
+    for hook in _SETTLE_HOOKS:
+        try:
+            hook(ax, pos, timed_out, gen)
+        except Exception as e:
+            print(f"[POLL] settle hook failed: {e}")
+    if mqtt_mgr:
+        mqtt_mgr.flush()  # settled value goes out now, not at the next rate slot
     _resume_keys()   # re-enable keyboard control now that motion is done
 
 
@@ -328,19 +825,9 @@ def _start_motion_poll(ax: int, target: float | None, *, suspend_keys: bool = Tr
     # optionally suspend key control for the duration of this motion
     if suspend_keys:
         _suspend_keys("axis moving")
-
-    if _MOTION_POLL[ax] is not None:
-        try:
-            root.after_cancel(_MOTION_POLL[ax])
-        except Exception:
-            pass
-        _MOTION_POLL[ax] = None
-
-    _LAST_POS[ax] = None
-    _STILL_COUNT[ax] = 0
-    _MOTION_POLL[ax] = root.after(
-        POLL_MS, lambda: _poll_until_settled(ax, target, time.time())
-    )
+    _SETTLED[ax].clear()
+    _TIMED_OUT[ax] = False
+    sampler.watch(ax, target)           # replaces any poll already running for ax
 
 
 
@@ -351,7 +838,10 @@ def move_abs(ax):
     except ValueError:
         log(f"[ABS] bad input for {AXES[ax]['lbl']}")
         return
+    _do_move_abs(ax, val)
 
+
+def _do_move_abs(ax: int, val: float) -> bool:
     # Clamp Z if needed
     if ax == 1:
         clamped = _clamp_z(val)
@@ -365,8 +855,9 @@ def move_abs(ax):
     if _ok(sp.MoCtrCard_MCrlAxisAbsMove(System.Byte(ax), System.Single(target))):
         log(f"[ABS] Axis {AXES[ax]['lbl']} => {target:.3f} {AXES[ax]['unit']}")
         _start_motion_poll(ax, target)  # keep UI/MQTT updating until motion settles
-    else:
-        log(f"[ABS] Axis {AXES[ax]['lbl']} ABS FAILED")
+        return True
+    log(f"[ABS] Axis {AXES[ax]['lbl']} ABS FAILED")
+    return False
 
 
 def move_rel(ax, sgn):
@@ -375,7 +866,10 @@ def move_rel(ax, sgn):
         step = float(txt) * sgn
     except ValueError:
         return log(f"[REL] bad input for {AXES[ax]['lbl']}")
+    _do_move_rel(ax, step)
+
 
+def _do_move_rel(ax: int, step: float) -> bool:
     pos, _, _ = read_axis(ax)                 # one-time read for target
     target = pos + step                       # default target for all axes
 
@@ -390,8 +884,9 @@ def move_rel(ax, sgn):
     if _ok(sp.MoCtrCard_MCrlAxisRelMove(System.Byte(ax), System.Single(step))):
         log(f"[REL] Axis {AXES[ax]['lbl']} move {step:+.3f} {AXES[ax]['unit']}")
         _start_motion_poll(ax, target)        # <-- target is always defined now
-    else:
-        log(f"[REL] Axis {AXES[ax]['lbl']} REL FAILED")
+        return True
+    log(f"[REL] Axis {AXES[ax]['lbl']} REL FAILED")
+    return False
 
 
 def home(ax: int):
@@ -400,8 +895,9 @@ def home(ax: int):
     if _ok(sp.MoCtrCard_MCrlAxisAbsMove(System.Byte(ax), System.Single(target))):
         log(f"[HOME] Axis {AXES[ax]['lbl']} => {target:.3f} {AXES[ax]['unit']}")
         _start_motion_poll(ax, target)
-    else:
-        log(f"[HOME] Axis {AXES[ax]['lbl']} HOME FAILED")
+        return True
+    log(f"[HOME] Axis {AXES[ax]['lbl']} HOME FAILED")
+    return False
 
 
 def set_defaults():
@@ -413,36 +909,610 @@ def set_defaults():
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-#  Keyboard jog
-# ─────────────────────────────────────────────────────────────────────────────
-# ─────────────────────────────────────────────────────────────────────────────
-#  Keyboard jog  —  velocity-mode start/stop
+#  Motion sequencer  (POST /api/program, "Sequence" dialog, sequencer.submit)
 # ─────────────────────────────────────────────────────────────────────────────
+#  A program is a list of steps.  Programs are queued and run back-to-back by
+#  one worker thread, whoever submitted them (API, GUI dialog or a script), so
+#  a transfer is one request instead of one round trip per move.  DLL calls
+#  are still made on the Tk thread (root.after_idle, like the keyboard hook);
+#  the worker only waits on _SETTLED, which the sampler's settle test sets.
+#
+#    {"op": "abs",      "axis": "z", "pos": 5.0}          move, wait to settle
+#    {"op": "rel",      "axis": "r", "delta": -1.5}       (add "wait": false
+#    {"op": "home",     "axis": "r"}                        to not wait)
+#    {"op": "velocity", "axis": "z", "value": 0.2}
+#    {"op": "accel",    "axis": "z", "value": 0.5}
+#    {"op": "dwell",    "seconds": 2.0}
+#    {"op": "settle"}  /  {"op": "settle", "axis": "z"}   wait for motion to end
+#    {"op": "stop"}    /  {"op": "stop",   "axis": "r"}   stop axis (all if none)
+PROGRAM_MAX_STEPS = cfg.getint("API", "program_max_steps", fallback=500)
+PROGRAM_KEEP      = 20               # finished jobs kept for GET /api/program
+PROGRAM_QUEUE_MAX = cfg.getint("API", "program_queue_max", fallback=20)
+_AXIS_NAMES       = {d['lbl'].lower(): ax for ax, d in AXES.items()}
+_MOVE_OPS         = ("abs", "rel", "home")
+_PARAM_OPS        = {"velocity": "velocity", "accel": "acceleration"}
+
+
+def _call_in_tk(fn, *args, timeout: float = 5.0):
+    """Run fn(*args) on the Tk thread and return its result to the caller."""
+    done, box = threading.Event(), {}
+
+    def _run():
+        try:
+            box["ret"] = fn(*args)
+        except Exception as e:
+            box["err"] = e
+        finally:
+            done.set()
+
+    root.after_idle(_run)
+    if not done.wait(timeout):
+        raise TimeoutError(f"{fn.__name__} not run by the GUI thread within {timeout:.0f}s")
+    if "err" in box:
+        raise box["err"]
+    return box.get("ret")
+
+
+def _parse_axis(step):
+    ax = step.get("axis")
+    if isinstance(ax, str):
+        ax = _AXIS_NAMES.get(ax.strip().lower())
+    if ax not in AXES:
+        raise ValueError(f"unknown axis {step.get('axis')!r}")
+    return ax
+
+
+def _parse_program(steps):
+    """Validate and normalise a step list before anything moves."""
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("'steps' must be a non-empty list")
+    if len(steps) > PROGRAM_MAX_STEPS:
+        raise ValueError(f"too many steps (max {PROGRAM_MAX_STEPS})")
+    out = []
+    for i, step in enumerate(steps):
+        try:
+            out.append(_parse_step(step))
+        except ValueError as e:
+            raise ValueError(f"step {i}: {e}") from None
+    return out
 
-# Per-axis jogging parameters
 
-_z_dir = 0       
-_z_job = None    
-_LIMIT_EPS = 0.01  
+def _parse_step(step):
+    """Normalise one step/command dict; raises ValueError with a short reason."""
+    try:
+        if not isinstance(step, dict):
+            raise ValueError("step must be an object")
+        op = str(step.get("op", "")).lower()
+        if op in _MOVE_OPS:
+            norm = {"op": op, "axis": _parse_axis(step),
+                    "wait": bool(step.get("wait", True))}
+            if op == "abs":
+                norm["pos"] = float(step["pos"])
+            elif op == "rel":
+                norm["delta"] = float(step["delta"])
+        elif op in _PARAM_OPS:
+            norm = {"op": op, "axis": _parse_axis(step), "value": float(step["value"])}
+            if norm["value"] <= 0:
+                raise ValueError("value must be > 0")
+        elif op == "dwell":
+            norm = {"op": op, "seconds": float(step["seconds"])}
+            if norm["seconds"] < 0:
+                raise ValueError("seconds must be >= 0")
+        elif op in ("settle", "stop"):
+            norm = {"op": op, "axis": _parse_axis(step) if "axis" in step else None}
+        else:
+            raise ValueError(f"unknown op {op!r}")
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"missing field {e}" if isinstance(e, KeyError) else str(e)) from None
+    return norm
+
+
+class ProgramCancelled(Exception):
+    pass
+
+
+class MotionProgram:
+    def __init__(self, steps, source="api"):
+        self.id       = uuid.uuid4().hex[:12]
+        self.steps    = steps
+        self.source   = source
+        self.state    = "queued"      # queued | running | done | failed | cancelled
+        self.index    = 0
+        self.error    = None
+        self.created  = time.time()
+        self.started  = None
+        self.finished = None
+        self.cancel   = threading.Event()
+
+    def as_dict(self):
+        step = self.steps[self.index] if self.state == "running" else None
+        if step and "axis" in step and step["axis"] is not None:
+            step = dict(step, axis=AXES[step["axis"]]['lbl'])
+        return {"id": self.id, "state": self.state, "source": self.source,
+                "step": self.index, "steps": len(self.steps), "current": step,
+                "created": self.created, "started": self.started,
+                "finished": self.finished, "error": self.error}
+
+
+class MotionSequencer:
+    """
+    FIFO of MotionPrograms served by one worker thread; keeps the last few
+    finished ones for status polls.  cancel() drops a queued program or stops
+    the running one at its next step/wait; estop() empties the queue and
+    stops every axis at once from the caller's thread (sp serialises the
+    DLL), without waiting for the worker or the Tk loop.
+    """
+    def __init__(self):
+        self.jobs   = {}
+        self.active = None
+        self._queue = deque()
+        self._cv    = threading.Condition()
+        threading.Thread(target=self._worker, daemon=True, name="motion-sequencer").start()
+
+    def submit(self, steps, *, source="api"):
+        return self.enqueue(MotionProgram(_parse_program(steps), source))
+
+    def enqueue(self, job):
+        """Queue an already-built program (steps are not re-validated)."""
+        with self._cv:
+            if len(self._queue) >= PROGRAM_QUEUE_MAX:
+                raise RuntimeError(f"sequence queue is full ({PROGRAM_QUEUE_MAX} programs)")
+            self._queue.append(job)
+            self.jobs[job.id] = job
+            for old in list(self.jobs.values())[:-PROGRAM_KEEP]:
+                if old.finished is not None:
+                    self.jobs.pop(old.id)
+            self._cv.notify()
+        return job
+
+    def queued(self):
+        with self._cv:
+            return list(self._queue)
+
+    def busy(self):
+        return self.active is not None or bool(self._queue)
+
+    def cancel(self, job_id):
+        with self._cv:
+            job = self.jobs.get(job_id)
+            if job is not None and job in self._queue:
+                self._queue.remove(job)
+                job.state, job.finished = "cancelled", time.time()
+        if job is not None:
+            job.cancel.set()
+        return job
+
+    def estop(self, reason="E-STOP"):
+        """Stop all axes now and cancel the running and every queued program."""
+        for ax in AXES:
+            sp.MoCtrCard_StopAxisMov(System.Byte(ax))
+        with self._cv:
+            dropped = list(self._queue)
+            self._queue.clear()
+            active = self.active
+        now = time.time()
+        for job in dropped:
+            job.state, job.finished = "cancelled", now
+            job.cancel.set()
+        if active is not None:
+            active.cancel.set()
+        root.after_idle(_estop_followup, reason, len(dropped) + (active is not None))
+        return len(dropped) + (active is not None)
+
+    # ---- worker ---------------------------------------------------------
+    def _wait_settled(self, job, axes, *, reached=False):
+        """Wait for the axes to be idle; reached=True also fails a move that
+        the sampler gave up on (settled by timeout, not at its target)."""
+        deadline = time.monotonic() + MOTION_TO_S + 5.0
+        for ax in axes:
+            while not _SETTLED[ax].wait(0.05):
+                if job.cancel.is_set():
+                    raise ProgramCancelled
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"axis {AXES[ax]['lbl']} did not settle")
+            if reached and _TIMED_OUT[ax]:
+                raise TimeoutError(f"axis {AXES[ax]['lbl']} did not reach its target")
+
+    def _dwell(self, job, seconds):
+        if job.cancel.wait(seconds):
+            raise ProgramCancelled
+
+    def _step(self, job, step):
+        op = step["op"]
+        ax = step.get("axis")
+        if op in _MOVE_OPS:
+            self._wait_settled(job, (ax,))       # never stack moves on one axis
+            if op == "abs":
+                ok = _call_in_tk(_do_move_abs, ax, step["pos"])
+            elif op == "rel":
+                ok = _call_in_tk(_do_move_rel, ax, step["delta"])
+            else:
+                ok = _call_in_tk(home, ax)
+            if not ok:
+                raise RuntimeError(f"{op} on axis {AXES[ax]['lbl']} rejected by controller")
+            if step["wait"]:
+                self._wait_settled(job, (ax,), reached=True)
+        elif op in _PARAM_OPS:
+            self._wait_settled(job, (ax,))       # _apply_param stops the axis
+            if not _call_in_tk(_apply_param, ax, _PARAM_OPS[op], step["value"]):
+                raise RuntimeError(f"{op} on axis {AXES[ax]['lbl']} rejected by controller")
+            self._wait_settled(job, (ax,))
+        elif op == "dwell":
+            self._dwell(job, step["seconds"])
+        elif op == "settle":
+            self._wait_settled(job, tuple(AXES) if ax is None else (ax,), reached=True)
+        elif op == "stop":
+            for a in (tuple(AXES) if ax is None else (ax,)):
+                _call_in_tk(stop_axis, a)
+        elif op == "point":                      # RasterScan grid point
+            if scan is None or scan.id != step["scan"]:
+                raise RuntimeError(f"scan {step['scan']} is no longer current")
+            scan._point(step)
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                while not self._queue:
+                    self._cv.wait()
+                job = self.active = self._queue.popleft()
+            try:
+                self._run(job)
+            finally:
+                with self._cv:
+                    self.active = None
+
+    def _run(self, job):
+        job.state, job.started = "running", time.time()
+        root.after_idle(log, f"[PRG] {job.id} started ({len(job.steps)} steps)")
+        try:
+            for job.index, step in enumerate(job.steps):
+                if job.cancel.is_set():
+                    raise ProgramCancelled
+                self._step(job, step)
+            job.state = "done"
+        except ProgramCancelled:
+            job.state = "cancelled"
+            for ax in AXES:
+                try:
+                    _call_in_tk(stop_axis, ax)
+                except Exception:
+                    pass
+        except Exception as e:
+            job.state, job.error = "failed", str(e)
+        finally:
+            job.finished = time.time()
+            msg = f"[PRG] {job.id} {job.state} at step {job.index}"
+            root.after_idle(log, msg + (f": {job.error}" if job.error else ""))
 
-def _guard_z_limit():
-    global _z_job, _z_dir
-    if _z_dir == 0:
-        _z_job = None
-        return
 
-    pos, _, _ = read_axis(1)                      # 20 Hz while *actively jogging*
-    update_state(1, pos=pos, publish=True)        # GUI/MQTT only when it changes
+def _estop_followup(reason, n_cancelled):
+    """Tk side of estop(): settle polls, key state and the log."""
+    for ax in AXES:
+        stop_axis(ax)
+    log(f"[{reason}] all axes stopped, {n_cancelled} program(s) cancelled")
 
-    if (_z_dir > 0 and pos >= Z_MAX - _LIMIT_EPS) or \
-       (_z_dir < 0 and pos <= Z_MIN + _LIMIT_EPS):
-        _stop_jog(1)
-        _z_dir = 0
-        _z_job = None
-        return
 
-    _z_job = root.after(50, _guard_z_limit)
+def _parse_step_text(line):
+    """One dialog line -> step dict: 'abs z 5', 'rel r -1.5', 'home r',
+    'velocity z 0.2', 'accel z 0.5', 'dwell 2', 'settle [z]', 'stop [r]'."""
+    op, *args = line.split()
+    op = op.lower()
+    try:
+        if op in ("abs", "rel", "velocity", "accel"):
+            axis, value = args
+            return {"op": op, "axis": axis, {"abs": "pos", "rel": "delta"}.get(op, "value"): value}
+        if op == "home":
+            (axis,) = args
+            return {"op": op, "axis": axis}
+        if op == "dwell":
+            (seconds,) = args
+            return {"op": op, "seconds": seconds}
+        if op in ("settle", "stop") and len(args) <= 1:
+            return {"op": op, **({"axis": args[0]} if args else {})}
+    except ValueError:
+        pass
+    raise ValueError(f"cannot read {line.strip()!r}")
+
 
+sequencer = MotionSequencer()
+
+
+@app.route("/api/program", methods=["POST"])
+def _program_post():
+    if not check_token():
+        return {"error": "Unauthorized"}, 401
+    body = request.get_json(silent=True)
+    steps = body.get("steps") if isinstance(body, dict) else body
+    try:
+        job = sequencer.submit(steps, source="api")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except RuntimeError as e:
+        return {"error": str(e)}, 409
+    return job.as_dict(), 202, {"Location": f"/api/program/{job.id}"}
+
+@app.route("/api/program")
+def _program_list():
+    active = sequencer.active
+    return {"active": active.id if active else None,
+            "queue": [j.id for j in sequencer.queued()],
+            "jobs": [j.as_dict() for j in list(sequencer.jobs.values())]}
+
+@app.route("/api/program/<job_id>")
+def _program_get(job_id):
+    job = sequencer.jobs.get(job_id)
+    return (job.as_dict(), 200) if job else ({"error": "unknown program"}, 404)
+
+@app.route("/api/program/<job_id>", methods=["DELETE"])
+def _program_cancel(job_id):
+    if not check_token():
+        return {"error": "Unauthorized"}, 401
+    job = sequencer.cancel(job_id)
+    return (job.as_dict(), 202) if job else ({"error": "unknown program"}, 404)
+
+@app.route("/api/estop", methods=["POST"])
+def _estop():
+    if not check_token():
+        return {"error": "Unauthorized"}, 401
+    return {"cancelled": sequencer.estop("E-STOP API")}, 200
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Raster scan over Z x R  (POST /api/scan, start_scan())
+# ─────────────────────────────────────────────────────────────────────────────
+#  Z steps through a range and R sweeps its angles at every Z.  The grid is
+#  turned into one precomputed sequencer program: abs moves (Z only when the
+#  row changes), settle, dwell, then a "point" step that fires the hooks -
+#  log, MQTT (<topic>/scan), _SCAN_HOOKS and the optional [Scan] hook_cmd.
+#  Serpentine order reverses R on every other row so R never rewinds.
+#  Progress is written to SCAN_STATE after each point; a cancelled, E-STOPped
+#  or crashed scan resumes at the first point whose hooks did not finish.
+
+SCAN_DWELL_S     = cfg.getfloat("Scan", "dwell_s", fallback=0.5)
+SCAN_SERPENTINE  = cfg.getboolean("Scan", "serpentine", fallback=True)
+SCAN_MAX_POINTS  = cfg.getint("Scan", "max_points", fallback=10000)
+SCAN_MQTT_TOPIC  = cfg.get("Scan", "mqtt_topic", fallback="").strip()
+SCAN_HOOK_CMD    = cfg.get("Scan", "hook_cmd", fallback="").strip()
+SCAN_HOOK_TO_S   = cfg.getfloat("Scan", "hook_timeout_s", fallback=60.0)
+SCAN_STATE       = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                cfg.get("Scan", "state_file", fallback="scan_state.json"))
+_SCAN_HOOKS      = []   # fn(record), called on the sequencer thread at each point
+
+
+def _scan_axis(name, spec):
+    """[start, stop, step] -> targets from start towards stop, never past it."""
+    try:
+        start, stop, step = (float(v) for v in spec)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be [start, stop, step]") from None
+    if not all(math.isfinite(v) for v in (start, stop, step)):
+        raise ValueError(f"{name} values must be finite")
+    if step <= 0:
+        raise ValueError(f"{name} step must be > 0")
+    span = abs(stop - start) / step
+    if span >= SCAN_MAX_POINTS:
+        raise ValueError(f"{name} has more than {SCAN_MAX_POINTS} steps")
+    n = math.floor(span + 1e-9)
+    sign = 1.0 if stop >= start else -1.0
+    return [round(start + sign * i * step, 6) for i in range(n + 1)]
+
+
+def _raster_points(zs, rs, serpentine=True):
+    """Z-major grid; with serpentine every other R row runs backwards."""
+    return [(z, r) for i, z in enumerate(zs)
+            for r in (rs[::-1] if serpentine and i % 2 else rs)]
+
+
+class RasterScan:
+    def __init__(self, params, points, *, scan_id=None, done=0, elapsed=0.0):
+        self.id      = scan_id or uuid.uuid4().hex[:12]
+        self.params  = params
+        self.points  = points
+        self.done    = done           # points whose hooks have completed
+        self.elapsed = elapsed        # seconds spent running, all runs
+        self.job     = None
+        self._run_t0 = None
+        self._run_n0 = done
+
+    @classmethod
+    def create(cls, z, r, *, dwell=None, serpentine=None):
+        zs, rs = _scan_axis("z", z), _scan_axis("r", r)
+        if min(zs) < Z_MIN or max(zs) > Z_MAX:
+            raise ValueError(f"z range must stay within {Z_MIN}–{Z_MAX}")
+        if len(zs) * len(rs) > SCAN_MAX_POINTS:
+            raise ValueError(f"{len(zs) * len(rs)} points (max {SCAN_MAX_POINTS})")
+        dwell = SCAN_DWELL_S if dwell is None else float(dwell)
+        if dwell < 0:
+            raise ValueError("dwell must be >= 0")
+        serpentine = SCAN_SERPENTINE if serpentine is None else bool(serpentine)
+        params = {"z": list(z), "r": list(r), "dwell": dwell, "serpentine": serpentine}
+        return cls(params, _raster_points(zs, rs, serpentine))
+
+    @classmethod
+    def load(cls):
+        """The scan saved in SCAN_STATE, or None."""
+        try:
+            with open(SCAN_STATE, encoding="utf-8") as f:
+                st = json.load(f)
+            return cls(st["params"], [tuple(p) for p in st["points"]],
+                       scan_id=st["id"], done=st["done"], elapsed=st["elapsed"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[SCAN] ignoring {SCAN_STATE}: {e}")
+            return None
+
+    def save(self):
+        tmp = SCAN_STATE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"id": self.id, "params": self.params, "points": self.points,
+                       "done": self.done, "elapsed": self._elapsed()}, f)
+        os.replace(tmp, SCAN_STATE)
+
+    # ---- run ----------------------------------------------------------------
+    @property
+    def running(self):
+        return self.job is not None and self.job.finished is None
+
+    @property
+    def complete(self):
+        return self.done >= len(self.points)
+
+    def moves(self, start=0):
+        """Sequencer steps for points[start:]; the first point moves both axes."""
+        steps, prev = [], (None, None)
+        for n in range(start, len(self.points)):
+            z, r = self.points[n]
+            if z != prev[0]:
+                steps.append({"op": "abs", "axis": 1, "pos": z, "wait": True})
+            if r != prev[1]:
+                steps.append({"op": "abs", "axis": 0, "pos": r, "wait": True})
+            steps.append({"op": "settle", "axis": None})
+            if self.params["dwell"] > 0:
+                steps.append({"op": "dwell", "seconds": self.params["dwell"]})
+            steps.append({"op": "point", "scan": self.id, "n": n})
+            prev = (z, r)
+        return steps
+
+    def start(self):
+        """Queue the remaining points (first run or resume)."""
+        if self.running:
+            raise RuntimeError(f"scan {self.id} is already running")
+        if self.complete:
+            raise RuntimeError(f"scan {self.id} is complete")
+        self.save()
+        self.elapsed, self._run_t0, self._run_n0 = self._elapsed(), None, self.done
+        self.job = sequencer.enqueue(MotionProgram(self.moves(self.done), "scan"))
+        return self.job
+
+    def _run_s(self):
+        if not self._run_t0:
+            return 0.0
+        return (self.job.finished or time.time()) - self._run_t0
+
+    def _elapsed(self):
+        return self.elapsed + self._run_s()
+
+    def _point(self, step):
+        n = step["n"]
+        if self._run_t0 is None:
+            self._run_t0 = self.job.started
+        z, r = self.points[n]
+        rec = {"scan": self.id, "n": n, "total": len(self.points), "z": z, "r": r,
+               "z_pos": round(read_axis(1)[0], 4),      # sequencer thread; sp serialises
+               "r_pos": round(read_axis(0)[0], 4),
+               "t": round(time.time(), 3)}
+        if mqtt_mgr and mqtt_mgr.client:
+            mqtt_mgr.client.publish(SCAN_MQTT_TOPIC or f"{mqtt_mgr.topic}/scan",
+                                    json.dumps(rec), qos=mqtt_mgr.qos)
+        for fn in list(_SCAN_HOOKS):
+            fn(rec)
+        if SCAN_HOOK_CMD:
+            ret = subprocess.run(SCAN_HOOK_CMD.format(**rec), shell=True,
+                                 timeout=SCAN_HOOK_TO_S).returncode
+            if ret != 0:
+                raise RuntimeError(f"scan hook exited with {ret} at point {n}")
+        self.done = n + 1
+        self.save()
+        rate = self.rate()
+        root.after_idle(log, f"[SCAN] {self.id} {self.done}/{len(self.points)} "
+                             f"Z={z:.3f} R={r:.3f}" + (f"  {rate:.0f} pts/h" if rate else ""))
+
+    # ---- stats --------------------------------------------------------------
+    def rate(self):
+        """Points/hour over the current run (settle + dwell + hooks + travel)."""
+        if not self._run_t0 or self.done <= self._run_n0:
+            return None
+        return (self.done - self._run_n0) * 3600.0 / max(self._run_s(), 1e-6)
+
+    def as_dict(self):
+        rate = self.rate()
+        left = len(self.points) - self.done
+        if self.running:
+            state = "running" if self.job.state == "running" else "queued"
+        else:
+            state = "done" if self.complete else ("interrupted" if self.done or self.job else "new")
+        return {"id": self.id, "state": state, "params": self.params,
+                "points": len(self.points), "done": self.done,
+                "program": self.job.as_dict() if self.job else None,
+                "elapsed_s": round(self._elapsed(), 1),
+                "points_per_hour": round(rate, 1) if rate else None,
+                "eta_s": round(left * 3600.0 / rate) if rate else None}
+
+
+scan = RasterScan.load()
+if scan is not None and not scan.complete:
+    root.after_idle(log, f"[SCAN] {scan.id} interrupted at {scan.done}/{len(scan.points)}"
+                         " - POST /api/scan/resume to continue")
+
+
+def start_scan(z, r, *, dwell=None, serpentine=None):
+    """Start a new scan, e.g. start_scan([0, 10, 0.5], [0, 90, 15], dwell=1)."""
+    global scan
+    if scan is not None and scan.running:
+        raise RuntimeError(f"scan {scan.id} is already running")
+    new, old = RasterScan.create(z, r, dwell=dwell, serpentine=serpentine), scan
+    scan = new                          # current before its point steps can run
+    try:
+        new.start()
+    except Exception:
+        scan = old
+        raise
+    return scan
+
+def resume_scan():
+    if scan is None:
+        raise RuntimeError("no scan to resume")
+    scan.start()
+    return scan
+
+
+@app.route("/api/scan", methods=["POST"])
+def _scan_post():
+    if not check_token():
+        return {"error": "Unauthorized"}, 401
+    body = request.get_json(silent=True) or {}
+    try:
+        s = start_scan(body.get("z"), body.get("r"),
+                       dwell=body.get("dwell"), serpentine=body.get("serpentine"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except RuntimeError as e:
+        return {"error": str(e)}, 409
+    return s.as_dict(), 202
+
+@app.route("/api/scan")
+def _scan_get():
+    return (scan.as_dict(), 200) if scan else ({"error": "no scan"}, 404)
+
+@app.route("/api/scan/resume", methods=["POST"])
+def _scan_resume():
+    if not check_token():
+        return {"error": "Unauthorized"}, 401
+    try:
+        s = resume_scan()
+    except RuntimeError as e:
+        return {"error": str(e)}, 409
+    return s.as_dict(), 202
+
+@app.route("/api/scan", methods=["DELETE"])
+def _scan_cancel():
+    if not check_token():
+        return {"error": "Unauthorized"}, 401
+    if scan is None or not scan.running:
+        return {"error": "no scan running"}, 404
+    sequencer.cancel(scan.job.id)
+    return scan.as_dict(), 202
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Keyboard jog
+# ─────────────────────────────────────────────────────────────────────────────
+# ─────────────────────────────────────────────────────────────────────────────
+#  Keyboard jog  —  velocity-mode start/stop
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Per-axis jogging parameters
 
 keys_held = set()    
 # ------------------------------------------------------------------
@@ -553,12 +1623,9 @@ def _start_jog(ax: int,
     if ret == sp.FUNRES_OK:
         log(f"[VEL] Jog {lbl} {'+' if direction>0 else '-'} "
             f"at {abs(v)} {AXES[ax]['vunit']}")
-        # kick off guard loop for Z
+        # Z soft-limit guard runs on the sampler thread
         if ax == 1:
-            global _z_dir, _z_job
-            _z_dir = direction
-            if _z_job is None:
-                _z_job = root.after(50, _guard_z_limit)
+            sampler.guard_z(direction)
     else:
         log(f"[VEL] Jog {lbl} command FAILED")
 
@@ -566,12 +1633,8 @@ def _start_jog(ax: int,
 def _stop_jog(ax: int):
     sp.MoCtrCard_StopAxisMov(System.Byte(ax))
     log(f"[VEL] Stop jog {AXES[ax]['lbl']}")
-    if ax == 1:                        
-        global _z_dir, _z_job          
-        _z_dir = 0                      
-        if _z_job is not None:            
-            root.after_cancel(_z_job)     
-            _z_job = None                 
+    if ax == 1:
+        sampler.guard_z(0)
 
 
 # --- incremental-step helper (for the old 6 shortcuts) -----------------------
@@ -587,7 +1650,7 @@ def _z_step(delta_mm: float):
     if _ok(sp.MoCtrCard_MCrlAxisRelMove(System.Byte(1), System.Single(delta))):
         log(f"[STEP] Z => {'UP' if delta > 0 else 'DOWN'} {abs(delta):.3f} mm")
         update_state(1, pos=pos + delta, publish=True)       # optimistic
-        root.after(150, lambda: update_state(1, readback=True))
+        _start_motion_poll(1, target, suspend_keys=False)     # sampler reads it back
 
 
 def key_down(event):
@@ -717,30 +1780,34 @@ def update_state(ax: int, *, pos=None, vel=None, acc=None, readback=False, publi
         p, v, a = pos, vel, acc
 
     changed = False
+    delta = {}
     cur = _state_cache[ax]
     prefix = 'r_' if ax == 0 else 'z_'
 
     if p is not None and _ne(p, cur["pos"], _EPS_POS):
         cur["pos"] = p
-        api_state[prefix + 'position'] = p
+        api_state[prefix + 'position'] = delta[prefix + 'position'] = p
         if pos_disp.get(ax):
             _update_gui_field(pos_disp[ax], f"{p:.3f}", readonly=True)
         changed = True
 
     if v is not None and _ne(v, cur["vel"], _EPS_VEL):
         cur["vel"] = v
-        api_state[prefix + 'velocity'] = v
+        api_state[prefix + 'velocity'] = delta[prefix + 'velocity'] = v
         if not edit_flag[(ax, 'velocity')]:
             _update_gui_field(entry[ax]['velocity'], f"{v:.3f}")
         changed = True
 
     if a is not None and _ne(a, cur["acc"], _EPS_ACC):
         cur["acc"] = a
-        api_state[prefix + 'acceleration'] = a
+        api_state[prefix + 'acceleration'] = delta[prefix + 'acceleration'] = a
         if not edit_flag[(ax, 'acceleration')]:
             _update_gui_field(entry[ax]['acceleration'], f"{a:.3f}")
         changed = True
 
+    if changed:
+        status_snapshot.publish(api_state)
+        ws_stream.push(delta)
     if changed and publish:
         _push_mqtt_if_changed()
 
@@ -751,7 +1818,202 @@ def update_state(ax: int, *, pos=None, vel=None, acc=None, readback=False, publi
 # ─────────────────────────────────────────────────────────────────────────
 #  MQTT Manager  (publishes telemetry + HA discovery)
 # ─────────────────────────────────────────────────────────────────────────
+class CoalescingPublisher:
+    """
+    Last-value-wins publisher keyed by topic.  A change on an idle topic goes
+    out at once; while values keep changing (axis moving) each topic is sent
+    at most max_hz times per second.  flush() sends anything pending now, so
+    the settled value is never held back.
+    """
+    def __init__(self, send, max_hz):
+        self._send     = send                       # send(topic, obj)
+        self.interval  = 1.0 / max_hz if max_hz > 0 else 0.0
+        self._cv       = threading.Condition()
+        self._pending  = {}
+        self._last     = {}
+        self._flush    = False
+        self._closed   = False
+        threading.Thread(target=self._run, daemon=True, name="mqtt-coalesce").start()
+
+    def submit(self, topic, obj):
+        with self._cv:
+            if topic in self._pending:
+                M_MQTT_COALESCED.inc()
+            self._pending[topic] = obj
+            self._cv.notify()
+
+    def flush(self):
+        with self._cv:
+            if self._pending:
+                self._flush = True
+                self._cv.notify()
+
+    def close(self):
+        self.flush()
+        with self._cv:
+            self._closed = True
+            self._cv.notify()
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while True:
+                    now = time.monotonic()
+                    due = [t for t in self._pending
+                           if self._flush or self._closed
+                           or now - self._last.get(t, float("-inf")) >= self.interval]
+                    if due or self._closed:
+                        break
+                    wait = (min(self._last[t] for t in self._pending) + self.interval - now
+                            if self._pending else None)
+                    self._cv.wait(wait)
+                self._flush = False
+                batch = [(t, self._pending.pop(t)) for t in due]
+                for t in due:
+                    self._last[t] = now
+                closed = self._closed and not self._pending
+            for topic, obj in batch:
+                try:
+                    self._send(topic, obj)
+                except Exception as e:
+                    print(f"[MQTT] publish error on {topic}: {e}")
+            if closed:
+                return
+
+
+class MotionCommands:
+    """
+    MQTT command channel.  Each message on command_topic is one step in the
+    /api/program format plus an optional correlation "id":
+
+        {"id": "a1", "op": "abs", "axis": "z", "pos": 5.0}
+        {"id": "a2", "op": "stop"}            ops: abs rel home stop velocity accel
+
+    The paho thread only queues the message; a worker validates it and runs
+    the DLL call on the Tk thread.  result_topic gets "accepted" (or
+    "rejected"), then "done"/"failed" with the final position when the settle
+    poll for that move ends.  A newer command, or any other move (GUI,
+    sequencer, scan) on the same axis, marks the older one "superseded".
+    """
+    OPS = _MOVE_OPS + tuple(_PARAM_OPS) + ("stop",)
+
+    def __init__(self, publish, result_topic):
+        self._publish     = publish                  # publish(topic, text)
+        self.result_topic = result_topic
+        self._queue       = queue.Queue()
+        self._inflight    = {}                        # ax -> (id, op, gen); Tk thread only
+        _SETTLE_HOOKS.append(self._settled)
+        threading.Thread(target=self._run, daemon=True, name="mqtt-commands").start()
+
+    def submit(self, payload):
+        self._queue.put(payload)
+
+    def close(self):
+        self._queue.put(None)
+
+    def _result(self, cid, op, state, **extra):
+        msg = {"id": cid, "op": op, "state": state, "ts": round(time.time(), 3)}
+        msg.update(extra)
+        try:
+            self._publish(self.result_topic, json.dumps(msg))
+        except Exception as e:
+            print(f"[MQTT] command result not sent: {e}")
+
+    def _run(self):
+        while True:
+            payload = self._queue.get()
+            if payload is None:
+                return
+            try:
+                cmd = json.loads(payload)
+            except ValueError:
+                self._result(None, None, "rejected", error="payload is not JSON")
+                continue
+            cid = cmd.get("id") if isinstance(cmd, dict) else None
+            cid = str(cid) if cid is not None else uuid.uuid4().hex[:12]
+            op  = cmd.get("op") if isinstance(cmd, dict) else None
+            try:
+                step = _parse_step(cmd)
+                if step["op"] not in self.OPS:
+                    raise ValueError(f"op {step['op']!r} is not a command")
+                if step["op"] != "stop" and sequencer.busy():
+                    raise ValueError("motion sequencer is busy")
+            except ValueError as e:
+                self._result(cid, op, "rejected", error=str(e))
+                continue
+            self._result(cid, step["op"], "accepted")
+            try:
+                _call_in_tk(self._start, cid, step)
+            except Exception as e:
+                self._result(cid, step["op"], "failed", error=str(e))
+
+    # ---- Tk thread ------------------------------------------------------
+    def _start(self, cid, step):
+        op, ax = step["op"], step["axis"]
+        axes = tuple(AXES) if ax is None else (ax,)
+        for a in axes:
+            prev = self._inflight.pop(a, None)
+            if prev is not None:
+                self._result(prev[0], prev[1], "superseded", by=cid)
+        if op == "stop":
+            if sequencer.busy():
+                sequencer.estop("MQTT stop")
+            for a in axes:
+                stop_axis(a)
+            self._result(cid, op, "done")
+            return
+        if op == "abs":
+            ok = _do_move_abs(ax, step["pos"])
+        elif op == "rel":
+            ok = _do_move_rel(ax, step["delta"])
+        elif op == "home":
+            ok = home(ax)
+        else:
+            ok = _apply_param(ax, _PARAM_OPS[op], step["value"])
+        if not ok:
+            self._result(cid, op, "failed", axis=AXES[ax]['lbl'],
+                         error="rejected by controller")
+            return
+        self._inflight[ax] = (cid, op, sampler.gen[ax])   # answered by _settled
+
+    def _settled(self, ax, pos, timed_out, gen):
+        entry = self._inflight.pop(ax, None)
+        if entry is None:
+            return
+        cid, op, own_gen = entry
+        if gen != own_gen:                        # another move took over the axis
+            self._result(cid, op, "superseded", axis=AXES[ax]['lbl'], by=None)
+            return
+        extra = {"axis": AXES[ax]['lbl'], "position": pos}
+        if timed_out:
+            extra["error"] = "timed out waiting to settle"
+        self._result(cid, op, "failed" if timed_out else "done", **extra)
+
+
+def _mqtt_client(client_id):
+    """
+    paho client for the broker, or a HubClient sharing the host-wide MQTT hub
+    connection when [MQTT] hub = host:port is set (see MQTTHub/mqtt_hub.py).
+    """
+    hub = cfg["MQTT"].get("hub", "").strip()
+    if not hub:
+        return mqtt.Client(client_id=client_id)
+    hub_dir = cfg["MQTT"].get("hub_dir", "") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "MQTTHub")
+    if hub_dir not in sys.path:
+        sys.path.insert(0, hub_dir)
+    from mqtt_hub import HubClient
+    return HubClient(hub, client_id=client_id)
+
+
 class MQTTManager:
+    """
+    Telemetry, HA discovery and the command channel over one paho client.
+    connect_async() leaves the TCP connect to paho's network thread, which
+    also reconnects with exponential backoff (reconnect_min_s..max_s), so an
+    unreachable broker never blocks the Tk thread.  `state` is connecting /
+    connected / disconnected; every change calls the `state_listeners`.
+    """
     def __init__(self, gui):
         self.gui   = gui
         if not MQTT_ENABLED:
@@ -760,31 +2022,86 @@ class MQTTManager:
         self.topic = cfg["MQTT"]["topic"]
         self.qos   = cfg.getint("MQTT","qos",fallback=0)
         self.retain= cfg.getboolean("MQTT","retain",fallback=False)
+        self.coalescer = CoalescingPublisher(self._send,
+                                             cfg.getfloat("MQTT","max_rate_hz",fallback=2.0))
 
-        self.client = mqtt.Client(client_id=cfg["MQTT"].get("client_id") or
-                                               f"Motion_{os.getpid()}")
+        self.client = _mqtt_client(cfg["MQTT"].get("client_id") or f"Motion_{os.getpid()}")
         user = cfg["MQTT"].get("username","")
         if user:
             self.client.username_pw_set(user, cfg["MQTT"].get("password",""))
-        self.client.on_connect = self._on_connect
-        self.client.connect(cfg["MQTT"]["host"], cfg.getint("MQTT","port"))
-        self.client.loop_start()
-        self.publish_discovery()
+        self.prefix = cfg["MQTT"].get("discovery_prefix","homeassistant").rstrip('/')
+        self.ha_status_topic = f"{self.prefix}/status"
+        self._discovery = self._build_discovery()
+        self._discovery_hash = hashlib.sha256(
+            "".join(t + "\0" + p for t, p in self._discovery).encode()).hexdigest()
+        self._discovery_sent = None                 # hash last published
+        self.cmd_topic = cfg["MQTT"].get("command_topic", "").strip()
+        self.commands  = None
+        if self.cmd_topic:
+            self.commands = MotionCommands(
+                lambda t, p: self.client.publish(t, p, qos=self.qos),
+                cfg["MQTT"].get("result_topic", "").strip() or f"{self.cmd_topic}/result")
+
+        self.state = "connecting"
+        self.state_listeners = []
 
-    # ---------- discovery on first connect ----------
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.on_disconnect   = lambda c, u, *a: self._set_state("disconnected")
+        self.client.on_connect_fail = lambda c, u: self._set_state("disconnected")
+        self.client.reconnect_delay_set(
+            min_delay=max(1, cfg.getint("MQTT","reconnect_min_s",fallback=1)),
+            max_delay=max(1, cfg.getint("MQTT","reconnect_max_s",fallback=60)))
+        try:
+            self.client.connect_async(cfg["MQTT"]["host"], cfg.getint("MQTT","port"))
+            self.client.loop_start()
+        except Exception as e:          # bad host/port in the INI, not an outage
+            print(f"[MQTT] connect error: {e}")
+            self.state = "disconnected"
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        for fn in list(self.state_listeners):
+            try:
+                fn(state)
+            except Exception as e:
+                print(f"[MQTT] state listener error: {e}")
+
+    # ---------- discovery: on first connect, on change, on HA restart ----------
     def _on_connect(self, client, userdata, flags, rc, *_):
         print("[MQTT] connected") if rc==0 else print("[MQTT] rc",rc)
+        self._set_state("connected" if rc==0 else "disconnected")
         if rc==0:
+            client.subscribe(self.ha_status_topic)
+            if self.commands:
+                client.subscribe(self.cmd_topic, qos=self.qos)
             self.publish_discovery()
 
-    def publish_discovery(self):
-        prefix = cfg["MQTT"].get("discovery_prefix","homeassistant").rstrip('/')
+    def _on_message(self, client, userdata, msg):
+        if msg.topic == self.ha_status_topic and msg.payload.strip().lower() == b"online":
+            self.publish_discovery(force=True)
+        elif self.commands and msg.topic == self.cmd_topic:
+            self.commands.submit(msg.payload)       # handled off the network thread
+
+    def publish_discovery(self, force=False):
+        """Publish the retained configs unless this exact set is already out."""
+        if not force and self._discovery_sent == self._discovery_hash:
+            return
+        for topic, payload in self._discovery:
+            self.client.publish(topic, payload, retain=True)
+        self._discovery_sent = self._discovery_hash
+
+    def _build_discovery(self):
+        prefix = self.prefix
         device = {
             "identifiers":  ["onway_motion"],
             "name":         "Onway Motion Controller",
             "manufacturer": "ONWAY",
             "model":        "MCC-4",
         }
+        msgs = []
         for axis,label in ((0,'r'),(1,'z')):
             for key in ("position","velocity","acceleration"):
                 uid   = f"onway_{label}_{key}"
@@ -799,19 +2116,31 @@ class MQTTManager:
                     "device_class": None,
                     "device": device
                 }
-                self.client.publish(topic,
-                    json.dumps(payload, ensure_ascii=False),
-                    retain=True)
+                msgs.append((topic, json.dumps(payload, ensure_ascii=False)))
+        return msgs
 
 
-    # ---------- publish telemetry ----------
+    # ---------- publish telemetry (coalesced) ----------
     def publish(self, js_obj):
         if self.client:
-            self.client.publish(self.topic, json.dumps(js_obj),
-                                qos=self.qos, retain=self.retain)
+            self.coalescer.submit(self.topic, js_obj)
+
+    def flush(self):
+        if self.client:
+            self.coalescer.flush()
+
+    def _send(self, topic, js_obj):
+        info = self.client.publish(topic, json.dumps(js_obj),
+                                   qos=self.qos, retain=self.retain)
+        M_MQTT_PUB.inc()
+        if info.rc != 0:
+            M_MQTT_FAIL.inc()
 
     def stop(self):
         if self.client:
+            self.coalescer.close()
+            if self.commands:
+                self.commands.close()
             self.client.loop_stop(); self.client.disconnect()
 
 mqtt_mgr = None
@@ -890,6 +2219,44 @@ def show_config_dialog():
     tk.Button(btn_fr, text="Cancel",  **std_btn, width=6,
               command=dlg.destroy).pack(side=tk.LEFT, padx=6)
 
+
+def show_sequence_dialog():
+    dlg = tk.Toplevel(root, bg=WHITE_BG)
+    dlg.title("Sequence")
+    dlg.configure(bd=1, relief="solid")
+    if ICON_PATH and os.path.exists(ICON_PATH):
+        try: dlg.iconbitmap(ICON_PATH)
+        except Exception: pass
+
+    tk.Label(dlg, text="One step per line:  abs z 5 | rel r -1.5 | home r |"
+                       " velocity z 0.2 | accel z 0.5 | dwell 2 | settle [z] | stop [r]",
+             font=POP_FONT, bg=WHITE_BG)\
+        .grid(row=0, column=0, columnspan=2, sticky="w", padx=6, pady=4)
+    steps_box = tk.Text(dlg, width=48, height=12, font=("Consolas", 10))
+    steps_box.grid(row=1, column=0, columnspan=2, padx=6, pady=4)
+    status = tk.Label(dlg, text="", font=POP_FONT, bg=WHITE_BG, anchor="w")
+    status.grid(row=2, column=0, columnspan=2, sticky="we", padx=6)
+
+    def _queue():
+        lines = [ln for ln in steps_box.get("1.0", tk.END).splitlines()
+                 if ln.strip() and not ln.lstrip().startswith("#")]
+        try:
+            job = sequencer.submit([_parse_step_text(ln) for ln in lines], source="gui")
+        except (ValueError, RuntimeError) as e:
+            status.config(text=str(e), fg="#CC0000")
+            return
+        status.config(text=f"queued {job.id} ({len(job.steps)} steps)", fg=ACCENT_COLOR)
+        log(f"[PRG] {job.id} queued from GUI, {len(sequencer.queued())} waiting")
+
+    btn_fr = tk.Frame(dlg, bg=WHITE_BG); btn_fr.grid(row=3, column=0,
+                                                     columnspan=2, pady=8)
+    tk.Button(btn_fr, text="Queue", **std_btn, width=6,
+              command=_queue).pack(side=tk.LEFT, padx=6)
+    tk.Button(btn_fr, text="E-STOP", **estop_btn,
+              command=lambda: sequencer.estop("E-STOP GUI")).pack(side=tk.LEFT, padx=6)
+    tk.Button(btn_fr, text="Close", **std_btn, width=6,
+              command=dlg.destroy).pack(side=tk.LEFT, padx=6)
+
 # ─────────────────────────────────────────────────────────────────────────────
 #  UI builder
 # ─────────────────────────────────────────────────────────────────────────────
@@ -947,6 +2314,10 @@ top=tk.Frame(settings,bg=WHITE_BG); top.pack(fill='x',pady=5)
 def _connect_clicked():
     if _ok(sp.MoCtrCard_Initial(com_var.get())):
         log("✅ Initialized")
+        for ax, cache in _PARAM_CACHE.items():
+            cache.clear()                        # re-read parameters from this card
+            _PARAM_GEN[ax] += 1
+        sampler.start_param_verify()
 
         # Read once from controller for both axes and update GUI/API/MQTT
         try:
@@ -961,10 +2332,21 @@ def _connect_clicked():
         if MQTT_ENABLED:
             global mqtt_mgr
             if mqtt_mgr is None:
-                mqtt_mgr = MQTTManager(root)
+                mqtt_mgr = MQTTManager(root)       # returns at once; paho connects
+                mqtt_mgr.state_listeners.append(lambda s: root.after_idle(_show_mqtt_state))
+                _show_mqtt_state()
     else:
         log("❌ Init failed")
 
+_MQTT_STATE_COLORS = {"connected": ACCENT_COLOR, "connecting": "#E6A100",
+                      "disconnected": "#C62828"}
+
+def _show_mqtt_state():
+    state = mqtt_mgr.state if mqtt_mgr else "off"
+    mqtt_status.config(text=f"MQTT: {state}", fg=_MQTT_STATE_COLORS.get(state, "#888888"))
+    if mqtt_mgr and state != "connecting":
+        log(f"[MQTT] {state}")
+
 # ── Settings top row  (all white, green-outline buttons) ────────────
 std_btn = dict(
     bg=WHITE_BG, fg=ACCENT_COLOR, font=BTN_FONT,
@@ -986,6 +2368,14 @@ tk.Button(top, text="Default", **std_btn, command=set_defaults)\
 tk.Button(top, text="Configuration", **std_btn,
           command=show_config_dialog)\
    .pack(side=tk.LEFT, padx=6)
+tk.Button(top, text="Sequence", **std_btn, command=show_sequence_dialog)\
+   .pack(side=tk.LEFT, padx=6)
+estop_btn = dict(std_btn, bg="#CC0000", fg="#FFFFFF")
+tk.Button(top, text="E-STOP", **estop_btn,
+          command=lambda: sequencer.estop("E-STOP GUI"))\
+   .pack(side=tk.LEFT, padx=6)
+mqtt_status = tk.Label(top, text="MQTT: off", font=POP_FONT, bg=WHITE_BG, fg="#888888")
+mqtt_status.pack(side=tk.LEFT, padx=6)
 
 # Right-side log view
 log_frame = tk.Frame(root, bg=WHITE_BG, bd=1, relief="solid")
@@ -1006,12 +2396,16 @@ keyboard.hook(_global_press)          # fires for both down & up
 keyboard.hook(_global_release)
 threading.Thread(target=keyboard.wait, daemon=True).start()
 
-if use_api.get(): threading.Thread(target=start_api,daemon=True).start()
+if use_api.get():
+    threading.Thread(target=start_api,daemon=True).start()
+    ws_stream.start(WS_PORT)
 
 def on_close():
     try:
         sp.MoCtrCard_Unload()
     finally:
+        stop_api()
+        ws_stream.stop()
         if mqtt_mgr:                    # stop MQTT loop nicely
             mqtt_mgr.stop()
         root.quit()
@@ -1075,12 +2469,16 @@ keyboard.hook(_global_press)          # fires for both down & up
 keyboard.hook(_global_release)
 threading.Thread(target=keyboard.wait, daemon=True).start()
 
-if use_api.get(): threading.Thread(target=start_api,daemon=True).start()
+if use_api.get():
+    threading.Thread(target=start_api,daemon=True).start()
+    ws_stream.start(WS_PORT)
 
 def on_close():
     try:
         sp.MoCtrCard_Unload()
     finally:
+        stop_api()
+        ws_stream.stop()
         if mqtt_mgr:                    # stop MQTT loop nicely
             mqtt_mgr.stop()
         root.quit()
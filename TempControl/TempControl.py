@@ -820,13 +820,16 @@
 
 
 import os
+import math
 import time
 import csv
+from collections import deque
 from datetime import datetime, timedelta
 import threading
+import queue
 import tkinter as tk
-from tkinter import filedialog, ttk
-from flask import Flask, request
+from tkinter import filedialog, messagebox, ttk
+from flask import Flask, Response, request, stream_with_context
 from flask_restful import Api, Resource
 from pymodbus.client import ModbusSerialClient as ModbusClient
 import matplotlib
@@ -836,7 +839,10 @@ import matplotlib.dates as mdates
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.ticker import MaxNLocator
 import json
+import uuid
+import hashlib
 import configparser
+from bisect import bisect_left
 from serial import SerialException
 # ──────────────────────────────────────────────────────────────
 #  Global configuration -- everything now comes from INI
@@ -893,6 +899,121 @@ data_store = {
 }
 last_param_values = {k: None for k in ("P", "I", "D", "Cycle", "Correction", "Filter", "OvertempAlarm")}
 
+# Acquisition → UI hand-off; drained only on the Tk main thread
+UI_FIELDS = ("Temperature", "Power", "SetTemperature")
+ui_queue = queue.Queue()
+
+def post_ui_snapshot():
+    """Queue a copy of the displayed values for the UI dispatcher."""
+    ui_queue.put({k: data_store.get(k) for k in UI_FIELDS})
+
+# --- Metrics (Prometheus text format at /metrics) ---
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    """Monotonic counter; inc() is a single in-place add, no lock."""
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self):
+        yield self.name, self.value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram.  observe() is a bisect plus two in-place adds
+    and takes no lock; under the GIL a collision can at worst lose one
+    observation, which is fine for monitoring.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets):
+        self.name, self.help = name, help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, v):
+        self._counts[bisect_left(self.buckets, v)] += 1
+        self._sum += v
+
+    def samples(self):
+        acc = 0
+        for le, n in zip(self.buckets, self._counts):
+            acc += n
+            yield f'{self.name}_bucket{{le="{le}"}}', acc
+        acc += self._counts[-1]
+        yield f'{self.name}_bucket{{le="+Inf"}}', acc
+        yield f"{self.name}_sum", round(self._sum, 6)
+        yield f"{self.name}_count", acc
+
+
+class Gauge:
+    """Value read at scrape time through `fn` – zero cost on the hot path."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        self.name, self.help, self.fn = name, help_text, fn
+
+    def samples(self):
+        try:
+            v = self.fn()
+        except Exception:
+            v = None
+        if v is not None:
+            yield self.name, v
+
+
+class MetricsRegistry:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._items = []
+
+    def _add(self, m):
+        self._items.append(m)
+        return m
+
+    def counter(self, name, help_text):
+        return self._add(Counter(self.prefix + name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, buckets))
+
+    def gauge(self, name, help_text, fn):
+        return self._add(Gauge(self.prefix + name, help_text, fn))
+
+    def render(self):
+        out = []
+        for m in self._items:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(f"{k} {float(v)!r}" for k, v in m.samples())
+        return "\n".join(out) + "\n"
+
+
+metrics = MetricsRegistry("onway_temp_")
+M_MODBUS_READ   = metrics.histogram("modbus_read_seconds", "Holding-register read latency incl. retries")
+M_MODBUS_WRITE  = metrics.histogram("modbus_write_seconds", "Register write latency")
+M_MODBUS_FAIL   = metrics.counter("modbus_read_failures_total", "Reads that gave up after all retries")
+M_POLL_PERIOD   = metrics.histogram("poll_cycle_seconds", "Period of the Modbus acquisition loop",
+                                    buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0))
+M_LOG_WRITE     = metrics.histogram("log_write_seconds", "Time to append one CSV log row (log writer lag)")
+M_MQTT_PUB      = metrics.counter("mqtt_publish_total", "MQTT telemetry publishes")
+M_MQTT_FAIL     = metrics.counter("mqtt_publish_failures_total", "MQTT publishes rejected by the client")
+M_WRITE_COALESCED = metrics.counter("register_writes_coalesced_total", "REST writes replaced by a newer value")
+M_API_THROTTLED   = metrics.counter("api_throttled_total", "Set-point requests refused by the per-client limit")
+metrics.gauge("temperature_celsius", "Measured temperature", lambda: data_store["Temperature"])
+metrics.gauge("power_percent", "Heater output power", lambda: data_store["Power"])
+metrics.gauge("setpoint_celsius", "Temperature set-point", lambda: data_store["SetTemperature"])
+metrics.gauge("ui_queue_depth", "Snapshots waiting for the UI dispatcher", lambda: ui_queue.qsize())
+
 # --- Token check ---
 def check_token():
     tok = request.headers.get("Authorization")
@@ -900,6 +1021,7 @@ def check_token():
 
 # --- Modbus read/write with retry & scaling ---
 def read_register(cli, address, slave=10, retries=5):
+    t0 = time.perf_counter()
     try:
         for _ in range(retries):
             rsp = cli.read_holding_registers(address, count=1, slave=slave)
@@ -911,12 +1033,19 @@ def read_register(cli, address, slave=10, retries=5):
             time.sleep(0.1)
     except SerialException as e:
         print("[Modbus] serial error:", e)
+    finally:
+        M_MODBUS_READ.observe(time.perf_counter() - t0)
+    M_MODBUS_FAIL.inc()
     return None
 def write_register(client, address, value, slave=10):
     # these registers need the /10 before writing
     if address in [18506, 18507, 18508, 18509, 18523, 18501, 2036]:
         value = value / 10
-    client.write_register(address, int(value * 10), slave=slave)
+    t0 = time.perf_counter()
+    try:
+        client.write_register(address, int(value * 10), slave=slave)
+    finally:
+        M_MODBUS_WRITE.observe(time.perf_counter() - t0)
 
 # --- Timestamp & CSV logging ---
 def _timestamp_parts():
@@ -927,6 +1056,7 @@ def _log_csv(prefix, header, row, log_dir):
     ts, month, date_s, time_s = _timestamp_parts()
     fn = os.path.join(log_dir, f"{prefix}_{month}.csv")
     is_new = not os.path.exists(fn)
+    t0 = time.perf_counter()
     try:
         with open(fn, "a", newline="", encoding=LOG_ENCODING) as f:
             w = csv.writer(f)
@@ -934,12 +1064,19 @@ def _log_csv(prefix, header, row, log_dir):
             w.writerow([ts, date_s, time_s] + row)
     except PermissionError:
         print(f"[Warning] Cannot write to '{fn}' – file is open?")
+    finally:
+        M_LOG_WRITE.observe(time.perf_counter() - t0)
 
 # --- Modbus polling loop ---
 def update_modbus_values_loop(app_ref):
     global stop_threads
+    last_cycle = None
     try:
         while not stop_threads and app_ref.running:
+            now = time.perf_counter()
+            if last_cycle is not None:
+                M_POLL_PERIOD.observe(now - last_cycle)
+            last_cycle = now
             temp = read_register(client, 18504)
             power = read_register(client, 2036)
             new_params = {
@@ -952,6 +1089,9 @@ def update_modbus_values_loop(app_ref):
                 "OvertempAlarm": read_register(client, 2490),
             }
             data_store.update(Temperature=temp, Power=power, **new_params)
+            post_ui_snapshot()
+            status_snapshot.publish(data_store)
+            stream_hub.publish(data_store)
 
             if app_ref.data_save_var.get() and temp is not None and power is not None:
                 _log_csv("TEMP_LOG", ["Timestamp","Date","Time","Temperature","Power"], [temp, power], app_ref.log_dir.get())
@@ -968,57 +1108,874 @@ def update_modbus_values_loop(app_ref):
         print("[Modbus] loop stopped:", e)
 
 
+# --- Server-Sent Events fan-out ---
+class _StreamClient:
+    __slots__ = ("fields", "queue", "alive")
+
+    def __init__(self, fields, backlog):
+        self.fields = fields
+        self.queue = queue.Queue(maxsize=backlog)
+        self.alive = True
+
+
+class SampleStream:
+    """
+    Fan-out of acquisition samples to /api/stream clients.
+
+    A sample is serialized once, field by field; each client's event is the
+    join of the fragments it asked for (shared between clients with the same
+    filter).  Clients get a small bounded queue and are dropped when it
+    overflows, so a stalled reader never holds back acquisition.
+    """
+
+    def __init__(self, max_clients=4, backlog=32):
+        self.max_clients = max_clients
+        self.backlog = backlog
+        self.seq = 0
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, fields):
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                return None
+            c = _StreamClient(tuple(fields), self.backlog)
+            self._clients.add(c)
+            return c
+
+    def unsubscribe(self, c):
+        c.alive = False
+        with self._lock:
+            self._clients.discard(c)
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = list(self._clients), set()
+        for c in clients:
+            c.alive = False
+
+    def publish(self, sample):
+        with self._lock:
+            if not self._clients:
+                return
+            self.seq += 1
+            seq, clients = self.seq, list(self._clients)
+
+        frags = {k: f'"{k}":{json.dumps(v)}' for k, v in sample.items()}
+        head = f'"seq":{seq},"ts":{time.time():.3f}'
+        events = {}
+        for c in clients:
+            ev = events.get(c.fields)
+            if ev is None:
+                body = ",".join([head] + [frags[k] for k in c.fields if k in frags])
+                ev = events[c.fields] = f"id: {seq}\ndata: {{{body}}}\n\n".encode()
+            try:
+                c.queue.put_nowait(ev)
+            except queue.Full:
+                print("[API] stream client too slow – dropped")
+                self.unsubscribe(c)
+
+
+stream_hub = SampleStream(
+    max_clients=cfg.getint("API", "max_stream_clients", fallback=4),
+    backlog=cfg.getint("API", "stream_backlog", fallback=32),
+)
+STREAM_PING_S = 15
+metrics.gauge("stream_clients", "Open /api/stream connections", lambda: len(stream_hub._clients))
+
+# --- History export (reads the TEMP_LOG_<month>.csv store) ---
+HISTORY_FIELDS     = ("Temperature", "Power")       # TEMP_LOG columns 3 and 4
+HISTORY_MAX_POINTS = 20000
+HISTORY_PAGE_MAX   = 100000
+
+# Folder the CSV logger writes to; the GUI points this at a plain copy of its
+# log_dir variable (kept on the Tk thread) so a Browse also moves what
+# /api/history reads without touching Tk from the API threads.
+log_dir_getter = lambda: cfg.get("Logging", "directory", fallback="") or os.getcwd()
+
+def _parse_time_arg(text, default):
+    """Unix seconds or ISO-8601 → naive local datetime (the log's clock)."""
+    if not text:
+        return default
+    try:
+        return datetime.fromtimestamp(float(text))
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+def _month_range(start, end):
+    y, m = start.year, start.month
+    while (y, m) <= (end.year, end.month):
+        yield f"{y:04d}-{m:02d}"
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+_midnight_cache = {}
+def _log_ts_seconds(ts):
+    """'YYYY-MM-DD HH:MM:SS' → epoch seconds, without strptime per row."""
+    day = ts[:10]
+    base = _midnight_cache.get(day)
+    if base is None:
+        base = _midnight_cache[day] = datetime.strptime(day, "%Y-%m-%d").timestamp()
+    return base + int(ts[11:13]) * 3600 + int(ts[14:16]) * 60 + int(ts[17:19])
+
+def _to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+def iter_temp_log(log_dir, start, end, skip=0):
+    """
+    Yield (epoch_s, ts, [Temperature, Power]) for start <= ts <= end, oldest
+    first, streaming one row at a time.  `skip` drops that many rows stamped
+    exactly `start` (cursor continuation).
+    """
+    start_s = start.strftime("%Y-%m-%d %H:%M:%S")
+    end_s   = end.strftime("%Y-%m-%d %H:%M:%S")
+    for month in _month_range(start, end):
+        fn = os.path.join(log_dir, f"TEMP_LOG_{month}.csv")
+        if not os.path.exists(fn):
+            continue
+        with open(fn, newline="", encoding=LOG_ENCODING) as f:
+            for row in csv.reader(f):
+                if len(row) < 5 or not row[0][:1].isdigit():
+                    continue                    # header / damaged line
+                ts = row[0]
+                if ts < start_s:
+                    continue
+                if ts > end_s:
+                    return
+                if skip and ts == start_s:
+                    skip -= 1
+                    continue
+                yield _log_ts_seconds(ts), ts, [_to_float(row[3]), _to_float(row[4])]
+
+def _ordered_pair(lo, hi):
+    if lo is hi:
+        return (lo,)
+    return (lo, hi) if lo[0] <= hi[0] else (hi, lo)
+
+def downsample_minmax(rows, t0, width, key):
+    """Per time bucket keep the rows holding the min and max of field `key`."""
+    bucket = lo = hi = None
+    for r in rows:
+        b = int((r[0] - t0) // width)
+        if b != bucket:
+            if lo is not None:
+                yield from _ordered_pair(lo, hi)
+            bucket, lo, hi = b, r, r
+            continue
+        v = r[2][key]
+        if v is None:
+            continue
+        if lo[2][key] is None or v < lo[2][key]:
+            lo = r
+        if hi[2][key] is None or v > hi[2][key]:
+            hi = r
+    if lo is not None:
+        yield from _ordered_pair(lo, hi)
+
+def _time_buckets(rows, t0, width):
+    cur, cur_b = [], None
+    for r in rows:
+        b = int((r[0] - t0) // width)
+        if cur and b != cur_b:
+            yield cur
+            cur = []
+        cur_b = b
+        cur.append(r)
+    if cur:
+        yield cur
+
+def _bucket_mean(points, key):
+    ys = [p[2][key] for p in points if p[2][key] is not None]
+    if not ys:
+        return None
+    return sum(p[0] for p in points) / len(points), sum(ys) / len(ys)
+
+def _lttb_pick(points, a, avg, key):
+    """Point of `points` spanning the largest triangle with `a` and `avg`."""
+    ay = a[2][key]
+    if ay is None or avg is None:
+        return points[0]
+    ax, (cx, cy) = a[0], avg
+    best, best_area = points[0], -1.0
+    for p in points:
+        py = p[2][key]
+        if py is None:
+            continue
+        area = abs((ax - cx) * (py - ay) - (ax - p[0]) * (cy - ay))
+        if area > best_area:
+            best, best_area = p, area
+    return best
+
+def downsample_lttb(rows, t0, width, key):
+    """
+    Largest-Triangle-Three-Buckets over fixed time buckets.  Only the
+    pending bucket and the one after it are held in memory.
+    """
+    prev = pending = None
+    for bucket in _time_buckets(rows, t0, width):
+        if prev is None:                    # first point is always kept
+            prev = bucket[0]
+            yield prev
+            bucket = bucket[1:]
+            if not bucket:
+                continue
+        if pending is not None:
+            prev = _lttb_pick(pending, prev, _bucket_mean(bucket, key), key)
+            yield prev
+        pending = bucket
+    if pending:
+        last = pending[-1]
+        if len(pending) > 1:
+            yield _lttb_pick(pending[:-1], prev, (last[0], last[2][key]), key)
+        yield last
+
+# --- Immutable status snapshots (pre-encoded JSON + ETag) ---
+class StatusSnapshot:
+    """
+    Latest published status as an immutable (seq, body, etag) tuple.
+
+    Writers call publish() after updating their state; the body is encoded
+    once and the sequence only advances when the content changed.  Readers
+    take `current` in a single attribute read, so they never see a
+    half-updated dict.
+    """
+
+    def __init__(self):
+        self._boot = format(int(time.time()), "x")
+        self._lock = threading.Lock()
+        self.current = (0, b"{}", f'"{self._boot}-0"')
+
+    def publish(self, state):
+        body = json.dumps(dict(state), separators=(",", ":")).encode()
+        with self._lock:
+            seq, old_body, _ = self.current
+            if body != old_body:
+                seq += 1
+                self.current = (seq, body, f'"{self._boot}-{seq}"')
+        return seq
+
+def snapshot_response(snapshot):
+    """200 with the pre-encoded body, or 304 if If-None-Match still matches."""
+    _, body, etag = snapshot.current
+    inm = request.headers.get("If-None-Match", "")
+    tags = [t.strip().removeprefix("W/") for t in inm.split(",")]
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in tags or "*" in tags:
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+status_snapshot = StatusSnapshot()
+
+# --- Set-point profiles (ramp / hold / step, run on the controller PC) ---
+#   {"segments": [{"type": "ramp", "to": 600, "rate": 5},      # °C/min
+#                 {"type": "ramp", "to": 650, "minutes": 20},   # or by time
+#                 {"type": "hold", "minutes": 30},
+#                 {"type": "step", "to": 200}]}
+PROFILE_TICK_S    = cfg.getfloat("Profile", "tick_s",           fallback=1.0)
+PROFILE_WRITE_S   = cfg.getfloat("Profile", "write_interval_s", fallback=5.0)
+PROFILE_MAX_SEGS  = cfg.getint("Profile",   "max_segments",     fallback=64)
+SETPOINT_RES      = 0.1          # register 3000 holds tenths of a degree
+
+def _plan_profile(segments, start_sp):
+    """Validate segments -> [(kind, sp_from, sp_to, seconds)], chained from start_sp."""
+    if not isinstance(segments, list) or not segments:
+        raise ValueError("'segments' must be a non-empty list")
+    if len(segments) > PROFILE_MAX_SEGS:
+        raise ValueError(f"too many segments (max {PROFILE_MAX_SEGS})")
+    plan, sp = [], start_sp
+    for i, seg in enumerate(segments):
+        try:
+            kind = str(seg.get("type", "")).lower()
+            if kind == "ramp":
+                to = float(seg["to"])
+                if "rate" in seg:
+                    rate = abs(float(seg["rate"]))
+                    if rate <= 0:
+                        raise ValueError("rate must be > 0")
+                    secs = abs(to - sp) / rate * 60
+                elif "minutes" in seg:
+                    secs = float(seg["minutes"]) * 60
+                else:
+                    raise ValueError("ramp needs 'rate' or 'minutes'")
+            elif kind == "hold":
+                to, secs = sp, float(seg["minutes"]) * 60
+            elif kind == "step":
+                to, secs = float(seg["to"]), float(seg.get("minutes", 0)) * 60
+            else:
+                raise ValueError(f"unknown type {kind!r}")
+            if secs < 0:
+                raise ValueError("duration must be >= 0")
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            msg = f"missing field {e}" if isinstance(e, KeyError) else str(e)
+            raise ValueError(f"segment {i}: {msg}") from None
+        plan.append((kind, sp, to, secs))
+        sp = to
+    return plan
+
+
+class ProfileRunner:
+    """
+    Walks a planned profile in its own thread and writes register 3000
+    at most once per PROFILE_WRITE_S (segment changes are written at once).
+    A set-point change from anywhere else pauses the run (manual override).
+    """
+    def __init__(self):
+        self._lock   = threading.Lock()
+        self._stop   = threading.Event()
+        self._thread = None
+        self.plan    = []
+        self.state   = "idle"           # idle | running | paused | done | aborted
+        self.reason  = None
+        self.index   = 0
+        self.elapsed = 0.0              # seconds into the current segment
+        self._written = None
+        self._last_write = 0.0
+
+    # ---- commands (any thread) -----------------------------------------
+    def load(self, segments):
+        if client is None:
+            raise RuntimeError("controller not connected")
+        start = data_store.get("SetTemperature")
+        if start is None:
+            start = data_store.get("Temperature")
+        if start is None:
+            raise RuntimeError("current set-point unknown")
+        plan = _plan_profile(segments, float(start))
+        self.abort("replaced")
+        with self._lock:
+            self.plan, self.index, self.elapsed = plan, 0, 0.0
+            self.state, self.reason = "running", None
+            self._written, self._last_write = float(start), 0.0
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,),
+                                            daemon=True, name="profile")
+            self._thread.start()
+        print(f"[Profile] started: {len(plan)} segments from {start:.1f}°C")
+
+    def pause(self, reason="paused"):
+        with self._lock:
+            if self.state != "running":
+                return False
+            self.state, self.reason = "paused", reason
+        print(f"[Profile] paused ({reason})")
+        return True
+
+    def resume(self):
+        with self._lock:
+            if self.state != "paused":
+                return False
+            self.state, self.reason = "running", None
+            self._written = data_store.get("SetTemperature")
+            data_store["manual_override"] = False
+        print("[Profile] resumed")
+        return True
+
+    def abort(self, reason="aborted"):
+        with self._lock:
+            if self.state not in ("running", "paused"):
+                return False
+            self.state, self.reason = "aborted", reason
+            self._stop.set()
+            data_store.update(Segment=None, SegmentLeft=None)
+        print(f"[Profile] aborted ({reason})")
+        return True
+
+    def status(self):
+        with self._lock:
+            active = self.state in ("running", "paused")
+            left = self._remaining() if active else 0.0
+            return {
+                "state":     self.state,
+                "reason":    self.reason,
+                "segment":   self.index + 1 if active else None,
+                "segments":  len(self.plan),
+                "type":      self.plan[self.index][0] if active else None,
+                "setpoint":  self._written,
+                "remaining_s": round(left, 1),
+                "eta":       (datetime.now() + timedelta(seconds=left)).isoformat(timespec="seconds")
+                             if self.state == "running" else None,
+            }
+
+    # ---- scheduler ------------------------------------------------------
+    def _remaining(self):
+        return (self.plan[self.index][3] - self.elapsed
+                + sum(seg[3] for seg in self.plan[self.index + 1:]))
+
+    def _target(self):
+        kind, sp_from, sp_to, secs = self.plan[self.index]
+        if kind != "ramp" or secs <= 0:
+            return sp_to
+        return sp_from + (sp_to - sp_from) * min(1.0, self.elapsed / secs)
+
+    def _run(self, stop):
+        last = time.monotonic()
+        while not stop.is_set() and not stop_threads:
+            write = False
+            now = time.monotonic()
+            dt, last = now - last, now
+            with self._lock:
+                if stop.is_set():
+                    break
+                shown = data_store.get("SetTemperature")
+                if (self.state == "running" and shown is not None and self._written is not None
+                        and abs(shown - self._written) > SETPOINT_RES / 2):
+                    self.state, self.reason = "paused", "manual override"
+                    data_store["manual_override"] = True
+                    print(f"[Profile] paused: set-point changed to {shown:.1f}°C")
+                seg_changed = False
+                if self.state == "running":
+                    self.elapsed += dt
+                    while self.elapsed >= self.plan[self.index][3]:
+                        if self.index + 1 == len(self.plan):
+                            break
+                        self.elapsed -= self.plan[self.index][3]
+                        self.index += 1
+                        seg_changed = True
+                    target = round(self._target(), 1)
+                    finished = (self.index + 1 == len(self.plan)
+                                and self.elapsed >= self.plan[self.index][3])
+                    due = seg_changed or finished or now - self._last_write >= PROFILE_WRITE_S
+                    write = due and abs(target - self._written) >= SETPOINT_RES / 2
+                    if write:
+                        self._written, self._last_write = target, now
+                        data_store["SetTemperature"] = target
+                    if finished and not write:
+                        self.state = "done"
+                left = self._remaining()
+                data_store.update(Segment=self.index + 1,
+                                  SegmentLeft=round(max(0.0, self.plan[self.index][3] - self.elapsed) / 60, 1))
+            if self.state == "running" and write:
+                try:
+                    write_register(client, 3000, target)
+                except Exception as e:
+                    self.pause(f"write failed: {e}")
+            if self.state == "done":
+                data_store.update(Segment=None, SegmentLeft=None)
+                print(f"[Profile] done at {self._written:.1f}°C")
+                break
+            stop.wait(min(PROFILE_TICK_S, max(left, 0.05)))
+
+
+profile_runner = ProfileRunner()
+
+def profile_command(body):
+    """Shared by REST, MQTT and the GUI: upload segments or pause/resume/abort."""
+    if isinstance(body, list):
+        body = {"segments": body}
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    if "segments" in body:
+        profile_runner.load(body["segments"])
+    else:
+        action = str(body.get("action", "")).lower()
+        if action not in ("pause", "resume", "abort"):
+            raise ValueError("expected 'segments' or action pause/resume/abort")
+        getattr(profile_runner, action)()
+    return profile_runner.status()
+
+# --- Admission for REST register writes (coalescing + per-client rate) ---
+WRITE_MIN_INTERVAL_S = cfg.getfloat("API", "write_min_interval_s", fallback=1.0)
+CLIENT_WRITE_RATE    = cfg.getfloat("API", "client_write_rate",    fallback=1.0)   # tokens/s, 0 = deny
+CLIENT_WRITE_BURST   = cfg.getfloat("API", "client_write_burst",   fallback=5.0)
+
+class TokenBucket:
+    """
+    Per-key token bucket; take() returns 0 when allowed, else seconds to wait.
+    rate <= 0 denies every request with a fixed deny_wait.
+    """
+    def __init__(self, rate, burst, max_keys=1024, deny_wait=60.0):
+        self.rate, self.burst, self.max_keys = rate, burst, max_keys
+        self.deny_wait = deny_wait
+        self._lock = threading.Lock()
+        self._keys = {}                 # key -> (tokens, monotonic)
+
+    def take(self, key):
+        if self.rate <= 0:
+            return self.deny_wait
+        now = time.monotonic()
+        with self._lock:
+            tokens, t = self._keys.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - t) * self.rate)
+            if tokens >= 1:
+                self._keys[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._keys[key] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            if len(self._keys) > self.max_keys:     # forget the idle ones
+                self._keys = {k: v for k, v in self._keys.items()
+                              if now - v[1] < self.burst / self.rate}
+        return wait
+
+
+class WriteCoalescer:
+    """
+    Serialises REST register writes onto one thread.  Writes to the same
+    register closer than min_interval collapse into one (last value wins);
+    every request gets a handle that /api/write/<handle> reports on.
+    """
+    def __init__(self, min_interval=1.0, keep=256):
+        self.min_interval = min_interval
+        self.keep     = keep
+        self._cv      = threading.Condition()
+        self._pending = {}              # address -> (value, [handle, ...])
+        self._last    = {}              # address -> monotonic of last write
+        self._handles = {}              # handle -> status dict (insertion ordered)
+        self._thread  = None
+        self._closed  = False
+
+    def submit(self, address, value):
+        """Queue a write and return its handle; RuntimeError once closed."""
+        handle = uuid.uuid4().hex[:12]
+        with self._cv:
+            if self._closed:
+                raise RuntimeError("register writer is shut down")
+            _, waiting = self._pending.get(address, (None, []))
+            if waiting:
+                M_WRITE_COALESCED.inc()
+            self._pending[address] = (value, waiting + [handle])
+            self._handles[handle] = {"handle": handle, "register": address,
+                                     "value": value, "state": "pending",
+                                     "queued": time.time()}
+            while len(self._handles) > self.keep:
+                self._handles.pop(next(iter(self._handles)))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name="register-writer")
+                self._thread.start()
+            self._cv.notify()
+        return handle
+
+    def status(self, handle):
+        with self._cv:
+            st = self._handles.get(handle)
+            return dict(st) if st else None
+
+    def pending(self):
+        with self._cv:
+            return len(self._pending)
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            for _, waiting in self._pending.values():   # never going to be written
+                for h in waiting:
+                    if h in self._handles:
+                        self._handles[h].update(state="failed", error="register writer is shut down")
+            self._pending.clear()
+            self._cv.notify()
+
+    def _next_due(self, now):
+        due = {a: self._last.get(a, 0.0) + self.min_interval for a in self._pending}
+        ready = [a for a, t in due.items() if t <= now]
+        return ready, (min(due.values()) - now if due else None)
+
+    def _run(self):
+        while True:
+            with self._cv:
+                ready, wait = self._next_due(time.monotonic())
+                while not ready and not self._closed:
+                    self._cv.wait(wait)
+                    ready, wait = self._next_due(time.monotonic())
+                if self._closed:
+                    return
+                address = ready[0]
+                value, waiting = self._pending.pop(address)
+                self._last[address] = time.monotonic()
+            try:
+                if client is None:
+                    raise RuntimeError("controller not connected")
+                write_register(client, address, value)
+                result = {"state": "written", "written": time.time()}
+            except Exception as e:
+                result = {"state": "failed", "error": str(e)}
+            with self._cv:
+                for h in waiting[:-1]:              # older requests: last value won
+                    if h in self._handles:
+                        self._handles[h].update(state="superseded", by=waiting[-1])
+                if waiting[-1] in self._handles:
+                    self._handles[waiting[-1]].update(result)
+
+
+register_writer = WriteCoalescer(WRITE_MIN_INTERVAL_S)
+write_buckets   = TokenBucket(CLIENT_WRITE_RATE, CLIENT_WRITE_BURST)
+metrics.gauge("register_writes_pending", "Registers with a queued REST write",
+              register_writer.pending)
+
+def admit_setpoint(val):
+    """Rate-check the caller and queue a set-point write -> (body, status, headers)."""
+    if not math.isfinite(val):                  # NaN/inf: not a temperature, not valid JSON
+        return {"error": "Invalid input"}, 400, {}
+    wait = write_buckets.take(request.remote_addr or "?")
+    if wait:
+        M_API_THROTTLED.inc()
+        return ({"error": "Too many set-point requests", "retry_after": round(wait, 1)},
+                429, {"Retry-After": str(max(1, round(wait)))})
+    try:
+        handle = register_writer.submit(3000, val)
+    except RuntimeError as e:
+        return {"error": str(e)}, 503, {}
+    data_store["SetTemperature"] = val
+    status_snapshot.publish(data_store)
+    return ({"message": "Set Temperature queued", "SetTemperature": val,
+             "handle": handle, "status": f"/api/write/{handle}"},
+            202, {"Location": f"/api/write/{handle}"})
+
 # --- REST API resources ---
 class DataAPI(Resource):
     def get(self):
-        return data_store
+        return snapshot_response(status_snapshot)
 
     def post(self):
-        val = request.json.get("SetTemperature")
+        val = _to_float((request.get_json(silent=True) or {}).get("SetTemperature"))
         if val is not None:
-            write_register(client, 3000, float(val))
-            data_store["SetTemperature"] = float(val)
-            return {"message": "Set Temperature updated", "SetTemperature": val}
+            return admit_setpoint(val)
         return {"error": "Invalid input"}, 400
 
 class SetpointAPI(Resource):
     def post(self):
         if not check_token():
             return {"error": "Unauthorized"}, 401
-        val = request.json.get("SetTemperature")
+        val = _to_float((request.get_json(silent=True) or {}).get("SetTemperature"))
         if val is not None:
-            write_register(client, 3000, float(val))
-            data_store["SetTemperature"] = float(val)
-
-            print(f"[✅] Setpoint manually updated to {val}°C (manual override)")
-            return {"message": "Set Temperature updated", "SetTemperature": val}
+            rsp = admit_setpoint(val)
+            if rsp[1] == 202:
+                print(f"[✅] Setpoint manually updated to {val}°C (manual override)")
+            return rsp
         return {"error": "Invalid input"}, 400
 
+class WriteStatusAPI(Resource):
+    """GET /api/write/<handle> – pending | written | superseded | failed."""
+    def get(self, handle):
+        st = register_writer.status(handle)
+        return st if st else ({"error": "Unknown handle"}, 404)
+
+class StreamAPI(Resource):
+    """GET /api/stream[?fields=Temperature,Power] – one SSE event per sample."""
+    def get(self):
+        fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+        unknown = [f for f in fields if f not in data_store]
+        if unknown:
+            return {"error": f"Unknown fields: {', '.join(unknown)}"}, 400
+        c = stream_hub.subscribe(fields or data_store.keys())
+        if c is None:
+            return {"error": "Too many stream clients"}, 503
+
+        def events():
+            try:
+                yield b"retry: 3000\n\n"
+                while c.alive:
+                    try:
+                        yield c.queue.get(timeout=STREAM_PING_S)
+                    except queue.Empty:
+                        yield b": ping\n\n"      # keeps proxies open, detects gone clients
+            finally:
+                stream_hub.unsubscribe(c)
+
+        return Response(stream_with_context(events()),
+                        mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache",
+                                 "X-Accel-Buffering": "no"})
+
+class HistoryAPI(Resource):
+    """
+    GET /api/history?start=&end=&fields=&max_points=&mode=&format=
+
+    start/end  : unix seconds or ISO-8601 (default: the last hour)
+    fields     : subset of Temperature,Power (the first one drives downsampling)
+    mode       : minmax (default) | lttb | raw
+    format     : ndjson (default) | csv
+    raw mode pages with limit= and cursor=; the last line carries next_cursor.
+    """
+    def get(self):
+        args = request.args
+        try:
+            end   = _parse_time_arg(args.get("end"), datetime.now())
+            start = _parse_time_arg(args.get("start"), end - timedelta(hours=1))
+            max_points = min(int(args.get("max_points", 1000)), HISTORY_MAX_POINTS)
+            limit = min(int(args.get("limit", 10000)), HISTORY_PAGE_MAX)
+        except (ValueError, OverflowError, OSError) as e:     # e.g. start=1e20 / inf
+            return {"error": f"Invalid argument: {e}"}, 400
+        fields = [f.strip() for f in args.get("fields", "").split(",") if f.strip()] \
+                 or list(HISTORY_FIELDS)
+        if any(f not in HISTORY_FIELDS for f in fields):
+            return {"error": f"fields must be from {', '.join(HISTORY_FIELDS)}"}, 400
+        mode = args.get("mode", "minmax").lower()
+        fmt  = args.get("format", "ndjson").lower()
+        if mode not in ("minmax", "lttb", "raw") or fmt not in ("ndjson", "csv"):
+            return {"error": "mode must be minmax|lttb|raw, format ndjson|csv"}, 400
+        if start > end or max_points < 2 or limit < 1:
+            return {"error": "Empty range or point budget"}, 400
+
+        skip = 0
+        cursor = args.get("cursor")
+        if cursor and mode == "raw":
+            try:
+                cur_ts, cur_n = cursor.rsplit("~", 1)
+                start, skip = datetime.fromisoformat(cur_ts), int(cur_n)
+            except ValueError:
+                return {"error": "Invalid cursor"}, 400
+
+        log_dir = log_dir_getter()
+        idx = [HISTORY_FIELDS.index(f) for f in fields]
+        rows = iter_temp_log(log_dir, start, end, skip)
+        if mode != "raw":
+            t0 = start.timestamp()
+            span = max(1.0, end.timestamp() - t0)
+            if mode == "minmax":
+                rows = downsample_minmax(rows, t0, span / (max_points // 2), idx[0])
+            else:
+                rows = downsample_lttb(rows, t0, span / max(1, max_points - 2), idx[0])
+
+        def encode(ts, vals):
+            if fmt == "csv":
+                return ",".join([ts] + ["" if vals[i] is None else repr(vals[i]) for i in idx]) + "\n"
+            rec = {"ts": ts}
+            rec.update((f, vals[i]) for f, i in zip(fields, idx))
+            return json.dumps(rec, separators=(",", ":")) + "\n"
+
+        def body():
+            if fmt == "csv":
+                yield ",".join(["Timestamp"] + fields) + "\n"
+            n, last_ts, same = 0, start.strftime("%Y-%m-%d %H:%M:%S"), skip
+            next_cursor = None
+            for _, ts, vals in rows:
+                if mode == "raw" and n == limit:
+                    next_cursor = f"{last_ts.replace(' ', 'T')}~{same}"
+                    break
+                same = same + 1 if ts == last_ts else 1
+                last_ts = ts
+                n += 1
+                yield encode(ts, vals)
+            if mode == "raw":
+                if fmt == "ndjson":
+                    yield json.dumps({"next_cursor": next_cursor}) + "\n"
+                elif next_cursor:
+                    yield f"# next_cursor={next_cursor}\n"
+
+        mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        return Response(stream_with_context(body()), mimetype=mimetype)
+
+class ProfileAPI(Resource):
+    """GET status; POST {"segments": [...]} or {"action": "pause|resume|abort"}."""
+    def get(self):
+        return profile_runner.status()
+
+    def post(self):
+        if not check_token():
+            return {"error": "Unauthorized"}, 401
+        try:
+            return profile_command(request.get_json(silent=True))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except RuntimeError as e:
+            return {"error": str(e)}, 409
+
+class MetricsAPI(Resource):
+    def get(self):
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 api.add_resource(DataAPI, "/api/data")
 api.add_resource(SetpointAPI, "/setpoint")
+api.add_resource(WriteStatusAPI, "/api/write/<string:handle>")
+api.add_resource(StreamAPI, "/api/stream")
+api.add_resource(HistoryAPI, "/api/history")
+api.add_resource(ProfileAPI, "/api/profile")
+api.add_resource(MetricsAPI, "/metrics")
+
+# ---- API serving ----  ([API] section; "flask" = development server)
+API_SERVER       = cfg.get("API", "server", fallback="waitress").strip().lower()
+API_THREADS      = cfg.getint("API", "threads", fallback=8)
+API_CONN_LIMIT   = cfg.getint("API", "connection_limit", fallback=100)
+API_KEEPALIVE_S  = cfg.getint("API", "keepalive_timeout", fallback=120)
+_wsgi_server = None
 
 def run_flask_app(port=5000):
-    app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
+    """Serve the Flask app; blocks until stop_flask_app() is called."""
+    global _wsgi_server
+    if API_SERVER == "waitress":
+        try:
+            from waitress import create_server
+        except ImportError:
+            print("[API] waitress not installed – using Flask dev server")
+        else:
+            _wsgi_server = create_server(
+                app, host="0.0.0.0", port=port,
+                threads=API_THREADS,
+                connection_limit=API_CONN_LIMIT,
+                channel_timeout=API_KEEPALIVE_S,   # idle keep-alive seconds
+                ident="onway-tempctl",
+            )
+            print(f"[API] waitress on :{port} ({API_THREADS} threads)")
+            try:
+                _wsgi_server.run()
+            except (OSError, ValueError):
+                pass                                # listener closed by stop
+            return
+    app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False, threaded=True)
+
+def stop_flask_app():
+    """Close the WSGI listener (the dev server dies with its daemon thread)."""
+    global _wsgi_server
+    srv, _wsgi_server = _wsgi_server, None
+    if srv is not None:
+        try:
+            srv.close()
+        except Exception as e:
+            print("[API] stop error:", e)
+
+
+def _mqtt_client(client_id):
+    """
+    paho client for the broker, or a HubClient sharing the host-wide MQTT hub
+    connection when [MQTT] hub = host:port is set (see MQTTHub/mqtt_hub.py).
+    """
+    hub = cfg.get("MQTT", "hub", fallback="").strip()
+    if not hub:
+        import paho.mqtt.client as mqtt
+        return mqtt.Client(client_id=client_id, clean_session=True)
+    import sys
+    hub_dir = cfg.get("MQTT", "hub_dir", fallback="") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "MQTTHub")
+    if hub_dir not in sys.path:
+        sys.path.insert(0, hub_dir)
+    from mqtt_hub import HubClient
+    return HubClient(hub, client_id=client_id)
 
 
 class MQTTManager:
     def __init__(self, *, host, port, topic_pub,
                  client_id, username, password,
                  setpoint_cmd_topic, discovery_prefix,
+                 profile_cmd_topic=None,
                  qos=0, retain=False, enable=True,
-                 gui_ref=None):
+                 gui_ref=None, reconnect_min=1, reconnect_max=60):
         """
         gui_ref: optional reference to the FurnaceGUI instance so we can
                  update GUI state when a set‑point command arrives.
+
+        The connection is made by paho's network thread (connect_async), so
+        an unreachable broker never blocks the caller; lost or failed
+        connections are retried with exponential backoff between
+        reconnect_min and reconnect_max seconds.  `state` is one of
+        connecting / connected / disconnected, and every change is passed
+        to the callables in `state_listeners` (on the paho thread).
         """
         self.enable = enable
         if not self.enable:
             self.client = None
             return
 
-        import os, paho.mqtt.client as mqtt
+        import os
         self.topic_pub          = topic_pub
         self.setpoint_cmd_topic = setpoint_cmd_topic
+        self.profile_cmd_topic  = profile_cmd_topic
         self.discovery_prefix   = discovery_prefix.rstrip('/')
         self.qos     = int(qos)
         self.retain  = bool(retain)
@@ -1027,28 +1984,63 @@ class MQTTManager:
         if not client_id:
             client_id = f"VCLPublisher_{os.getpid()}"
 
-        self.client = mqtt.Client(client_id=client_id, clean_session=True)
+        self.client = _mqtt_client(client_id)
         if username:
             self.client.username_pw_set(username, password or None)
 
-        self.client.on_connect    = self._on_connect
-        self.client.on_message    = self._on_message
-        self.client.on_disconnect = lambda c, u, r: print("[MQTT] disconnected")
+        self.ha_status_topic = f"{self.discovery_prefix}/status"
+        self._discovery = self._build_discovery()
+        self._discovery_hash = hashlib.sha256(
+            "".join(t + "\0" + p for t, p in self._discovery).encode()).hexdigest()
+        self._discovery_sent = None                 # hash last published
+
+        self.state = "connecting"
+        self.state_listeners = []
+
+        self.client.on_connect      = self._on_connect
+        self.client.on_message      = self._on_message
+        self.client.on_disconnect   = lambda c, u, *a: self._set_state("disconnected")
+        self.client.on_connect_fail = lambda c, u: self._set_state("disconnected")
+        self.client.reconnect_delay_set(min_delay=max(1, int(reconnect_min)),
+                                        max_delay=max(1, int(reconnect_max)))
 
         try:
-            self.client.connect(host, int(port), keepalive=60)
+            self.client.connect_async(host, int(port), keepalive=60)
             self.client.loop_start()
-        except Exception as e:
+        except Exception as e:          # bad host/port in the INI, not an outage
             print(f"[MQTT] connect error: {e}")
             self.enable = False
 
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        print(f"[MQTT] {state}")
+        for fn in list(self.state_listeners):
+            try:
+                fn(state)
+            except Exception as e:
+                print(f"[MQTT] state listener error: {e}")
+
     # ------------------------------------------------------------------ #
     # Discovery
     # ------------------------------------------------------------------ #
-    def publish_discovery(self):
-        """Publish Home-Assistant discovery config (retain=True)."""
+    def publish_discovery(self, force=False):
+        """
+        Publish Home-Assistant discovery config (retain=True) – skipped when
+        the same set (by hash) already went out on an earlier connect.
+        """
         if not self.enable:
             return
+        if not force and self._discovery_sent == self._discovery_hash:
+            return
+        for topic, payload in self._discovery:
+            self.client.publish(topic, payload, retain=True)
+        self._discovery_sent = self._discovery_hash
+
+    def _build_discovery(self):
+        """Discovery messages as (topic, json text), built once."""
+        msgs = []
 
         # ---- device info (from INI if available) ----
         if hasattr(self.gui_ref, "cfg"):
@@ -1086,7 +2078,7 @@ class MQTTManager:
                 "device_class": conf["device_class"],
                 "device": device_info
             }
-            self.client.publish(topic, json.dumps(payload), retain=True)
+            msgs.append((topic, json.dumps(payload)))
 
         # ---- writable number (set-point) ----
         num_topic = f"{self.discovery_prefix}/number/onway_setpoint/config"
@@ -1103,7 +2095,8 @@ class MQTTManager:
             "unique_id": "onway_setpoint_number",
             "device": device_info
         }
-        self.client.publish(num_topic, json.dumps(payload), retain=True)
+        msgs.append((num_topic, json.dumps(payload)))
+        return msgs
 
 
     # ------------------------------------------------------------------ #
@@ -1111,15 +2104,30 @@ class MQTTManager:
     # ------------------------------------------------------------------ #
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            print("[MQTT] connected")
+            self._set_state("connected")
             # subscribe for set‑point commands
             client.subscribe(self.setpoint_cmd_topic, qos=self.qos)
-            # publish discovery once per connection
+            if self.profile_cmd_topic:
+                client.subscribe(self.profile_cmd_topic, qos=self.qos)
+            client.subscribe(self.ha_status_topic, qos=self.qos)
+            # discovery only if not already published (or changed)
             self.publish_discovery()
         else:
             print(f"[MQTT] connect rc={rc}")
+            self._set_state("disconnected")
 
     def _on_message(self, client, userdata, msg):
+        if msg.topic == self.ha_status_topic:
+            if msg.payload.strip().lower() == b"online":   # HA restarted
+                self.publish_discovery(force=True)
+            return
+        if msg.topic == self.profile_cmd_topic:
+            try:
+                st = profile_command(json.loads(msg.payload.decode()))
+                print(f"[MQTT] profile {st['state']}")
+            except Exception as e:
+                print(f"[MQTT] profile error: {e}")
+            return
         try:
             raw = msg.payload.decode()
             try:
@@ -1128,6 +2136,8 @@ class MQTTManager:
             except (json.JSONDecodeError, KeyError, ValueError):
                 new_sv = float(raw)
 
+            if not math.isfinite(new_sv):
+                raise ValueError(f"non-finite set-point {raw!r}")
             print(f"[MQTT] received new set-point {new_sv}")
             if self.gui_ref:
                 self.gui_ref.apply_remote_setpoint(new_sv)
@@ -1140,15 +2150,121 @@ class MQTTManager:
     # ------------------------------------------------------------------ #
     def publish(self, payload_dict):
         if self.enable and self.client:
-            self.client.publish(
+            info = self.client.publish(
                 self.topic_pub, json.dumps(payload_dict),
                 qos=self.qos, retain=self.retain
             )
+            M_MQTT_PUB.inc()
+            if info.rc != 0:
+                M_MQTT_FAIL.inc()
 API_PORT = cfg.getint("General", "api_port", fallback=5000)   # ← NEW
 ACCENT_COLOR = "#2E7D32"                    # fresh green accent
 WHITE_BG   = "#FFFFFF"                 # uniform background
 POP_FONT   = ("Arial", max(8, BASE_FONT_SIZE - 7))   # smaller than before
 BTN_FONT = ("Arial", 14)     # ← change 14 to any size you like
+
+# ---- chart render pacing ----
+TARGET_FPS  = cfg.getfloat("UI", "target_fps",  fallback=4.0)
+MAX_BACKOFF = cfg.getfloat("UI", "max_backoff", fallback=8.0)
+
+
+class RenderGovernor:
+    """
+    Paces chart redraws on the Tk main loop.
+
+    Draws at most `target_fps` times per second and only when new data was
+    buffered.  If a draw takes longer than half its frame budget the frame
+    interval is stretched (up to `max_backoff` x) and relaxed again once
+    draws become cheap.  While the window is iconified or unmapped nothing
+    is drawn at all; data keeps buffering and one catch-up draw happens on
+    restore.
+    """
+
+    def __init__(self, master, draw_fn, *, target_fps=4.0, max_backoff=8.0):
+        self.master = master
+        self.draw_fn = draw_fn
+        self.frame_ms = 1000.0 / max(0.1, float(target_fps))
+        self.max_backoff = max(1.0, float(max_backoff))
+        self.backoff = 1.0
+        self.dirty = False
+        self.visible = True
+        self.last_draw_ms = 0.0
+        self._after_id = None
+        self._running = False
+
+        # <Map>/<Unmap> on the toplevel also fire for every child widget
+        master.bind("<Map>",   self._on_map,   add="+")
+        master.bind("<Unmap>", self._on_unmap, add="+")
+
+    def start(self):
+        self._running = True
+        self._schedule(self.frame_ms)
+
+    def stop(self):
+        self._running = False
+        self._cancel()
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    # ------------------------------------------------------------------ #
+    def _interval_ms(self):
+        return int(self.frame_ms * self.backoff)
+
+    def _schedule(self, delay_ms):
+        self._cancel()
+        if self._running:
+            self._after_id = self.master.after(int(delay_ms), self._tick)
+
+    def _cancel(self):
+        if self._after_id is not None:
+            try:
+                self.master.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _window_hidden(self):
+        try:
+            return (not self.visible) or self.master.state() in ("iconic", "withdrawn")
+        except tk.TclError:
+            return True
+
+    def _tick(self):
+        self._after_id = None
+        if self._window_hidden():
+            return                      # resumes from _on_map
+        if self.dirty:
+            self.dirty = False
+            t0 = time.perf_counter()
+            try:
+                self.draw_fn()
+            except Exception as e:
+                print("[UI] chart draw failed:", e)
+            self.last_draw_ms = (time.perf_counter() - t0) * 1000.0
+            self._adapt(self.last_draw_ms)
+        self._schedule(self._interval_ms())
+
+    def _adapt(self, draw_ms):
+        budget = 0.5 * self.frame_ms * self.backoff
+        if draw_ms > budget:
+            self.backoff = min(self.max_backoff, self.backoff * 1.5)
+        elif draw_ms < 0.25 * budget and self.backoff > 1.0:
+            self.backoff = max(1.0, self.backoff / 1.25)
+
+    def _on_map(self, event):
+        if event.widget is not self.master:
+            return
+        self.visible = True
+        self._schedule(0)               # catch up immediately on restore
+
+    def _on_unmap(self, event):
+        if event.widget is not self.master:
+            return
+        self.visible = False
+        self._cancel()
+
+
 class TemperatureControlApp:
     def __init__(self, master):
         self.cfg = cfg
@@ -1168,6 +2284,8 @@ class TemperatureControlApp:
         self.running = True
         self.api_thread = None
         self.modbus_thread = None
+        self._ui_after_id = None
+        self._shown = {}                    # last text/value pushed to each widget
         # shared data controls
         self.set_point_var = tk.StringVar()
         self.com_var       = tk.StringVar(value=SERIAL_OPTS["port"])
@@ -1176,10 +2294,14 @@ class TemperatureControlApp:
         self.port_var      = tk.StringVar(value=str(API_PORT))   
         self.log_dir       = tk.StringVar(value=self.cfg.get("Logging", "directory",
                                                             fallback=os.getcwd()))
+        self.log_dir_path  = self.log_dir.get()     # plain copy for non-Tk threads
+        self.log_dir.trace_add("write", lambda *_: setattr(self, "log_dir_path", self.log_dir.get()))
+        global log_dir_getter
+        log_dir_getter = lambda: self.log_dir_path
 
         # plotting buffers
-        self.times = []
-        self.temps = []
+        self.times = deque()
+        self.temps = deque()
         self.last_plot_ts = datetime.min
         # build the UI
         self._build_layout()
@@ -1187,6 +2309,10 @@ class TemperatureControlApp:
         self._build_config_panel()
         self._build_chart_panel()
         self._bind_keys()
+        self.render_gov = RenderGovernor(self.master, self._draw_chart,
+                                         target_fps=TARGET_FPS,
+                                         max_backoff=MAX_BACKOFF)
+        self.render_gov.start()
         self._schedule_ui_refresh()
 
     # ───────────────────────────────────────────────
@@ -1255,6 +2381,60 @@ class TemperatureControlApp:
                 command=dlg.destroy)\
             .pack(side=tk.LEFT, padx=8)
 
+    # ───────────────────────────────────────────────
+    #  Set-point profile – load JSON, pause/resume/abort
+    # ───────────────────────────────────────────────
+    def show_profile_dialog(self):
+        dlg = tk.Toplevel(self.master, bg="#FFFFFF")
+        dlg.title("Set-point Profile")
+        dlg.transient(self.master)
+        if ICON_PATH and os.path.exists(ICON_PATH):
+            try: dlg.iconbitmap(ICON_PATH)
+            except Exception: pass
+
+        status = tk.Label(dlg, font=POP_FONT, bg="#FFFFFF", fg="#000000",
+                          justify="left", anchor="w", width=34)
+        status.grid(row=0, column=0, columnspan=4, sticky="w", padx=6, pady=6)
+
+        def run(fn):
+            try:
+                fn()
+            except (ValueError, RuntimeError, OSError) as e:
+                messagebox.showerror("Profile", str(e), parent=dlg)
+            refresh()
+
+        def load():
+            fn = filedialog.askopenfilename(parent=dlg, filetypes=[("JSON", "*.json")])
+            if fn:
+                with open(fn, encoding="utf-8") as f:
+                    profile_command(json.load(f))
+
+        def refresh():
+            st = profile_runner.status()
+            text = f"State: {st['state']}"
+            if st["reason"]:
+                text += f" ({st['reason']})"
+            if st["segment"]:
+                text += (f"\nSegment {st['segment']}/{st['segments']} ({st['type']})"
+                         f"\nRemaining: {st['remaining_s'] / 60:.1f} min")
+            if st["eta"]:
+                text += f"\nETA: {st['eta'].replace('T', ' ')}"
+            status.config(text=text)
+
+        def poll():
+            if dlg.winfo_exists():
+                refresh()
+                dlg.after(1000, poll)
+
+        for col, (txt, fn) in enumerate((("Load…", load),
+                                         ("Pause", profile_runner.pause),
+                                         ("Resume", profile_runner.resume),
+                                         ("Abort", profile_runner.abort))):
+            tk.Button(dlg, text=txt, font=POP_FONT, width=7,
+                      command=lambda fn=fn: run(fn))\
+                .grid(row=1, column=col, padx=6, pady=8)
+        poll()
+
     def _browse_dir(self, var):
         folder = filedialog.askdirectory(initialdir=var.get() or os.getcwd())
         if folder: var.set(folder)
@@ -1280,10 +2460,29 @@ class TemperatureControlApp:
 
 
     def _schedule_ui_refresh(self):
-        self._refresh_readouts()
+        """
+        Single UI dispatcher: drain the acquisition queue, keep only the
+        newest snapshot and apply it.  Runs on the Tk main thread only.
+        """
+        snap = None
+        try:
+            while True:
+                snap = ui_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        if snap is not None:
+            self._refresh_readouts(snap)
+            if self.mqtt_mgr:
+                self.mqtt_mgr.publish({
+                    "Temperature":  snap["Temperature"],
+                    "Power":        snap["Power"],
+                    "Setpoint":     snap["SetTemperature"]
+                })
+        self._update_mqtt_status()
+
         if self.running:
-            # 100ms later, schedule again on the main thread
-            self.master.after(250, self._schedule_ui_refresh)
+            self._ui_after_id = self.master.after(250, self._schedule_ui_refresh)
 
 
     def _build_layout(self):
@@ -1357,11 +2556,21 @@ class TemperatureControlApp:
                 command=self.show_config_dialog)\
         .grid(row=0, column=1, padx=8, pady=4)
 
+        tk.Button(cfg, text="Profile", **std_btn,
+                command=self.show_profile_dialog)\
+        .grid(row=1, column=0, columnspan=2, padx=8, pady=4)
+
+        self.mqtt_status = tk.Label(cfg, text="MQTT: off", font=POP_FONT,
+                                    bg=WHITE_BG, fg="#888888")
+        self.mqtt_status.grid(row=2, column=0, columnspan=2, pady=(4, 0))
+
 
     def _build_chart_panel(self):
         self.fig, self.ax = plt.subplots(figsize=(4, 3))
         self.ax.set_xlabel("Time");  self.ax.set_ylabel("Temperature (°C)")
         (self.line,) = self.ax.plot([], [], marker="o", markersize=2, linestyle="-")
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
+        self.ax.tick_params(axis='x', rotation=45)
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.right_frame)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
@@ -1384,14 +2593,6 @@ class TemperatureControlApp:
         self.master.bind("<KeyPress-plus>",   self.on_key_up)
         self.master.bind("<KeyPress-minus>", self.on_key_down)
     
-    def _start_ui_thread(self):
-        """Spawn GUI/MQTT refresh loop in its own daemon thread."""
-        self.ui_thread = threading.Thread(
-            target=self.ui_update_loop,
-            daemon=True
-        )
-        self.ui_thread.start()
-
     def on_init_controller(self):
         """Connect to the controller, then launch Modbus, API, and MQTT threads."""
         # ── 1.  open serial link ──────────────────────────────────────────
@@ -1408,7 +2609,6 @@ class TemperatureControlApp:
 
         # ── 3.  make sure log directory exists ───────────────────────────
         self._ensure_log_dir(self.log_dir.get())
-        self._start_ui_thread()
         # ── 4.  start background threads ─────────────────────────────────
         self._start_modbus_thread()
 
@@ -1454,6 +2654,8 @@ class TemperatureControlApp:
         self.modbus_thread.start()
     def _start_api_thread(self, port_num):
         """Spawn Flask API in its own thread."""
+        if self.api_thread and self.api_thread.is_alive():
+            return                          # already serving (re-Connect)
         self.api_thread = threading.Thread(
             target=run_flask_app,
             args=(port_num,),
@@ -1504,24 +2706,10 @@ class TemperatureControlApp:
     def on_key_down(self, event):
         self._bump_set_point(-1)
     # ---------------------------------------------------------
-    def ui_update_loop(self):
-        try:
-            while not stop_threads and self.running:
-                self._refresh_readouts()
-                if self.mqtt_mgr:
-                    self.mqtt_mgr.publish({
-                        "Temperature":  data_store["Temperature"],
-                        "Power":        data_store["Power"],
-                        "Setpoint":     data_store["SetTemperature"]
-                    })
-                time.sleep(0.1)
-        except Exception as e:
-            print("[UI] loop stopped:", e)
-
-    def _refresh_readouts(self):
-            temp  = data_store.get("Temperature")
-            power = data_store.get("Power")
-            spt   = data_store.get("SetTemperature")
+    def _refresh_readouts(self, snap):
+            temp  = snap.get("Temperature")
+            power = snap.get("Power")
+            spt   = snap.get("SetTemperature")
 
             self._update_temp_label(temp)
             self._update_power_display(power)
@@ -1530,23 +2718,33 @@ class TemperatureControlApp:
             if temp is not None:
                 self.add_temp_to_plot(temp)
 
+    def _changed(self, key, value):
+        """True (and remember value) if `key` differs from what is shown."""
+        if self._shown.get(key, object()) == value:
+            return False
+        self._shown[key] = value
+        return True
+
     def _update_temp_label(self, temp):
         text = f"{temp:.1f}" if temp is not None else "--"
-        self.temp_label_number.config(text=text)
+        if self._changed("temp", text):
+            self.temp_label_number.config(text=text)
 
     def _update_power_display(self, power):
         if power is not None:
-            p_val = max(0, min(100, power))
-            self.power_bar["value"] = p_val
-            self.power_percent_label.config(text=f"{power:.1f}%")
+            p_val, text = max(0, min(100, power)), f"{power:.1f}%"
         else:
-            self.power_bar["value"] = 0
-            self.power_percent_label.config(text="--%")
+            p_val, text = 0, "--%"
+        if self._changed("power", text):
+            self.power_bar["value"] = p_val
+            self.power_percent_label.config(text=text)
 
     def _update_setpoint_entry(self, spt):
         # only overwrite if user isn’t actively typing
         if not self.entry_typing and spt is not None:
-            self.set_point_var.set(f"{spt:.1f}")
+            text = f"{spt:.1f}"
+            if self.set_point_var.get() != text:
+                self.set_point_var.set(text)
 
     def add_temp_to_plot(self, temp):
         now = datetime.now()
@@ -1560,17 +2758,19 @@ class TemperatureControlApp:
         # keep only last 30 min of data
         cutoff = now - timedelta(minutes=30)
         while self.times and self.times[0] < cutoff:
-            self.times.pop(0); self.temps.pop(0)
+            self.times.popleft(); self.temps.popleft()
+
+        # drawing is paced by the render governor
+        self.render_gov.mark_dirty()
 
-        self.line.set_data(self.times, self.temps)
+    def _draw_chart(self):
+        self.line.set_data(list(self.times), list(self.temps))
         self.ax.relim()                 # update data limits—but…
         if self.toolbar.mode == "":     # …only autoscale when user NOT panning/zooming
             self.ax.autoscale_view()    # preserves manual zoom until Home is pressed
 
-        self.ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
-        self.ax.tick_params(axis='x', rotation=45)
         self.fig.tight_layout()
-        self.canvas.draw_idle()
+        self.canvas.draw()              # synchronous so the governor can time it
 
 
 
@@ -1587,16 +2787,31 @@ class TemperatureControlApp:
             username  = self.cfg["MQTT"].get("username", ""),
             password  = self.cfg["MQTT"].get("password", ""),
             setpoint_cmd_topic = f"{topic_pub}/set",    # writable number entity
+            profile_cmd_topic  = f"{topic_pub}/profile",
             discovery_prefix   = "homeassistant",
             qos     = self.cfg.getint("MQTT", "qos",    fallback=0),
             retain  = self.cfg.getboolean("MQTT", "retain", fallback=False),
+            reconnect_min = self.cfg.getfloat("MQTT", "reconnect_min_s", fallback=1),
+            reconnect_max = self.cfg.getfloat("MQTT", "reconnect_max_s", fallback=60),
             gui_ref = self                                  # let MQTTManager call us
         )
 
+    MQTT_STATE_COLORS = {"connected": ACCENT_COLOR, "connecting": "#E6A100",
+                         "disconnected": "#C62828"}
+
+    def _update_mqtt_status(self):
+        """Mirror mqtt_mgr.state (set on the paho thread) in the status label."""
+        mgr = self.mqtt_mgr
+        state = mgr.state if mgr and mgr.enable else "off"
+        if self.mqtt_status.cget("text") != f"MQTT: {state}":
+            self.mqtt_status.config(text=f"MQTT: {state}",
+                                    fg=self.MQTT_STATE_COLORS.get(state, "#888888"))
+
     # called by MQTTManager when a remote user changes the set-point in HA
+    # (runs on the paho thread, so the entry is updated via the UI queue)
     def apply_remote_setpoint(self, new_sv):
         data_store["SetTemperature"] = new_sv
-        self.set_point_var.set(f"{new_sv:.1f}")
+        post_ui_snapshot()
         threading.Thread(
             target=write_register,
             args=(client, 3000, new_sv),
@@ -1608,8 +2823,13 @@ class TemperatureControlApp:
         global stop_threads
         stop_threads = True
         self.running = False
-        try: self.master.after_cancel(self._schedule_ui_refresh)  # no stray after
+        try: self.master.after_cancel(self._ui_after_id)  # no stray after
         except Exception: pass
+        self.render_gov.stop()
+        profile_runner.abort("shutdown")
+        register_writer.close()
+        stream_hub.close()
+        stop_flask_app()
         if client:
             client.close()
         if self.mqtt_mgr:
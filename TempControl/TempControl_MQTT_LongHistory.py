@@ -1,8 +1,10 @@
 import os
 import time
 import csv
+from collections import deque
 from datetime import datetime, timedelta, timezone
 import threading
+import queue
 import tkinter as tk
 from tkinter import filedialog, ttk
 from flask import Flask, request
@@ -15,6 +17,9 @@ import matplotlib.dates as mdates
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.ticker import MaxNLocator
 import json
+import math
+import hashlib
+import struct
 import configparser
 from serial import SerialException
 # ──────────────────────────────────────────────────────────────
@@ -72,6 +77,14 @@ data_store = {
 }
 last_param_values = {k: None for k in ("P", "I", "D", "Cycle", "Correction", "Filter", "OvertempAlarm")}
 
+# Acquisition → UI hand-off; drained only on the Tk main thread
+UI_FIELDS = ("Temperature", "Power", "SetTemperature")
+ui_queue = queue.Queue()
+
+def post_ui_snapshot():
+    """Queue a copy of the displayed values for the UI dispatcher."""
+    ui_queue.put({k: data_store.get(k) for k in UI_FIELDS})
+
 # --- Token check ---
 def check_token():
     tok = request.headers.get("Authorization")
@@ -131,6 +144,7 @@ def update_modbus_values_loop(app_ref):
                 "OvertempAlarm": read_register(client, 2490),
             }
             data_store.update(Temperature=temp, Power=power, **new_params)
+            post_ui_snapshot()
 
             if app_ref.data_save_var.get() and temp is not None and power is not None:
                 _log_csv("TEMP_LOG", ["Timestamp","Date","Time","Temperature","Power"], [temp, power], app_ref.log_dir.get())
@@ -180,6 +194,109 @@ def run_flask_app(port=5000):
     app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
 
 
+class HistorySpool:
+    """
+    Bounded on-disk FIFO of history messages, kept as numbered JSON-lines
+    segment files so a backlog survives a restart.  When max_bytes is
+    exceeded the oldest segment is dropped.
+    """
+
+    def __init__(self, directory, max_bytes, segment_records=500):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.segment_records = max(1, int(segment_records))
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._segments = sorted(int(fn[6:-6]) for fn in os.listdir(directory)
+                                if fn.startswith("spool_") and fn.endswith(".jsonl")
+                                and fn[6:-6].isdigit())
+        self._bytes = sum(os.path.getsize(self._path(n)) for n in self._segments)
+        self._open_records = 0          # records in the newest segment
+
+    def _path(self, n):
+        return os.path.join(self.directory, f"spool_{n:09d}.jsonl")
+
+    def __bool__(self):
+        with self._lock:
+            return self._bytes > 0
+
+    def append(self, text):
+        line = (text.replace("\n", " ") + "\n").encode("utf-8")
+        with self._lock:
+            if not self._segments or self._open_records >= self.segment_records:
+                self._segments.append(self._segments[-1] + 1 if self._segments else 1)
+                self._open_records = 0
+            with open(self._path(self._segments[-1]), "ab") as f:
+                f.write(line)
+            self._open_records += 1
+            self._bytes += len(line)
+            while self._bytes > self.max_bytes and len(self._segments) > 1:
+                self._drop(self._segments[0])
+                print("[MQTT] spool full – dropped oldest segment")
+
+    def _drop(self, n):
+        path = self._path(n)
+        try:
+            self._bytes -= os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            pass
+        self._segments.remove(n)
+
+    def take_oldest(self):
+        """Close off and return (segment, lines) for the oldest segment, or None."""
+        with self._lock:
+            while self._segments:
+                n = self._segments[0]
+                if not os.path.exists(self._path(n)):
+                    if n == self._segments[-1]:
+                        return None             # newest segment, nothing written yet
+                    self._segments.remove(n)
+                    continue
+                if n == self._segments[-1]:     # start a fresh one for new appends
+                    self._segments.append(n + 1)
+                    self._open_records = 0
+                with open(self._path(n), "rb") as f:
+                    return n, f.read().decode("utf-8", errors="replace").splitlines()
+            return None
+
+    def done(self, n):
+        with self._lock:
+            if n in self._segments:
+                self._drop(n)
+
+    def requeue(self, n, lines):
+        """Rewrite segment n with the lines that were not delivered."""
+        data = "".join(line + "\n" for line in lines).encode("utf-8")
+        with self._lock:
+            path = self._path(n)
+            try:
+                old = os.path.getsize(path)
+                with open(path, "wb") as f:
+                    f.write(data)
+                self._bytes += len(data) - old
+            except OSError as e:
+                print(f"[MQTT] spool rewrite error: {e}")
+
+
+def _mqtt_client(client_id):
+    """
+    paho client for the broker, or a HubClient sharing the host-wide MQTT hub
+    connection when [MQTT] hub = host:port is set (see MQTTHub/mqtt_hub.py).
+    """
+    hub = cfg.get("MQTT", "hub", fallback="").strip()
+    if not hub:
+        import paho.mqtt.client as mqtt
+        return mqtt.Client(client_id=client_id, clean_session=True)
+    import sys
+    hub_dir = cfg.get("MQTT", "hub_dir", fallback="") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "MQTTHub")
+    if hub_dir not in sys.path:
+        sys.path.insert(0, hub_dir)
+    from mqtt_hub import HubClient
+    return HubClient(hub, client_id=client_id)
+
+
 class MQTTManager:
     """
     MQTT manager for versioned telemetry, Home Assistant discovery, availability,
@@ -187,10 +304,35 @@ class MQTTManager:
 
     The payload keeps the original flat keys for compatibility and adds stable
     metadata plus a normalized "metrics" object for long-term storage systems.
+
+    With delta_mode on, full "key" frames (retained) go out every
+    keyframe_interval seconds and the samples in between carry only the fields
+    that changed since the previous frame ("delta", not retained).  Consumers
+    use `sequence` to spot gaps and may ask for a keyframe on keyframe_topic.
+
+    History samples are batched: one message on history_topic carries up to
+    history_batch_size records (or history_batch_age seconds worth) as rows of
+    `history_columns` under a single shared header.  While the broker is
+    unreachable those messages go to an on-disk HistorySpool and are drained
+    in order, at spool_drain_rate messages/s, from a thread after reconnect.
+
+    The broker connection is made by paho's network thread (connect_async),
+    so an unreachable broker never blocks the GUI; lost or failed connections
+    are retried with exponential backoff between reconnect_min and
+    reconnect_max seconds.  `state` is connecting / connected / disconnected
+    and each change is passed to the callables in `state_listeners`.
+
+    If binary_topic is set every published sample is also sent there as one
+    fixed-size little-endian struct (layout id, sequence, unix_time, then the
+    history metrics as float32, NaN = missing).  The layout is described in
+    the "binary" block of the retained schema message; decode_mqtt_binary.py
+    unpacks it.
     """
 
     SCHEMA_NAME = "wanglab.controller.telemetry"
     SCHEMA_VERSION = 2
+    FRAME_KEYS = ("schema", "schema_version", "device_type", "device_id", "device_name",
+                  "sequence", "ts", "unix_time", "metrics", "frame")
 
     def __init__(self, *, host, port, topic_pub,
                  client_id, username, password,
@@ -202,14 +344,23 @@ class MQTTManager:
                  entity_prefix_name="",
                  publish_interval=1.0,
                  expire_after=300,
-                 history_topic=""):
+                 history_topic="",
+                 delta_mode=False,
+                 keyframe_interval=60.0,
+                 history_batch_size=60,
+                 history_batch_age=60.0,
+                 spool_dir="",
+                 spool_max_bytes=0,
+                 spool_drain_rate=20.0,
+                 binary_topic="",
+                 reconnect_min=1,
+                 reconnect_max=60):
         self.enable = bool(enable)
         self.client = None
         if not self.enable:
             return
 
         import os
-        import paho.mqtt.client as mqtt
 
         self.topic_pub = str(topic_pub).rstrip("/")
         self.setpoint_cmd_topic = str(setpoint_cmd_topic or f"{self.topic_pub}/set")
@@ -229,30 +380,80 @@ class MQTTManager:
         self.availability_topic = f"{self.topic_pub}/availability"
         self.schema_topic = f"{self.topic_pub}/schema"
         self.ha_status_topic = f"{self.discovery_prefix}/status"
+        self.delta_mode = bool(delta_mode)
+        self.keyframe_interval = max(0.0, float(keyframe_interval or 0.0))
+        self.keyframe_topic = f"{self.topic_pub}/keyframe"
         self.sensor_definitions = self._sensor_definitions()
+        self._compile_payload_plan()
+        self.history_batch_size = max(1, int(history_batch_size or 1))
+        self.history_batch_age = max(0.0, float(history_batch_age or 0.0))
+        self.history_metrics = tuple(conf["metric"] for conf in self.sensor_definitions.values()
+                                     if conf.get("metric"))
+        self.history_columns = ("sequence", "unix_time") + self.history_metrics
+        self.binary_topic = str(binary_topic or "").strip().rstrip("/")
+        self._binary = struct.Struct("<HId" + "f" * len(self.history_metrics))
+        self.binary_columns = ("layout_id",) + self.history_columns
+        layout = json.dumps([self._binary.format, self.binary_columns]).encode()
+        self._binary_layout = int.from_bytes(hashlib.sha256(layout).digest()[:2], "little")
+        self._history_lock = threading.Lock()
+        self._history_batch = []
+        self._history_batch_started = 0.0
+        self.spool = None
+        self.spool_drain_rate = max(0.1, float(spool_drain_rate or 0.1))
+        self._drain_thread = None
+        if self.history_topic and spool_dir and spool_max_bytes > 0:
+            try:
+                self.spool = HistorySpool(spool_dir, spool_max_bytes)
+            except OSError as e:
+                print(f"[MQTT] spool disabled: {e}")
         self._last_publish_monotonic = 0.0
         self._last_payload = None
         self._sequence = 0
+        self._sent_fields = None
+        self._sent_metrics = {}
+        self._key_sequence = 0
+        self._last_keyframe_monotonic = 0.0
+        self._keyframe_due = True
+        self._discovery = None
+        self._discovery_hash = None
+        self._discovery_sent = None
 
         if not client_id:
             client_id = f"{self._sanitize_id(self.device_id)}_publisher_{os.getpid()}"
 
-        self.client = mqtt.Client(client_id=client_id, clean_session=True)
+        self.client = _mqtt_client(client_id)
         if username:
             self.client.username_pw_set(username, password or None)
 
+        self.state = "connecting"
+        self.state_listeners = []
+
         self.client.will_set(self.availability_topic, payload="offline", qos=self.qos, retain=True)
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
-        self.client.on_disconnect = lambda c, u, *args: print("[MQTT] disconnected")
+        self.client.on_disconnect = lambda c, u, *args: self._set_state("disconnected")
+        self.client.on_connect_fail = lambda c, u: self._set_state("disconnected")
+        self.client.reconnect_delay_set(min_delay=max(1, int(reconnect_min)),
+                                        max_delay=max(1, int(reconnect_max)))
 
         try:
-            self.client.connect(host, int(port), keepalive=60)
+            self.client.connect_async(host, int(port), keepalive=60)
             self.client.loop_start()
-        except Exception as e:
+        except Exception as e:          # bad host/port in the INI, not an outage
             print(f"[MQTT] connect error: {e}")
             self.enable = False
 
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        print(f"[MQTT] {state}")
+        for fn in list(self.state_listeners):
+            try:
+                fn(state)
+            except Exception as e:
+                print(f"[MQTT] state listener error: {e}")
+
     def _cfg_get(self, section, option, fallback=""):
         try:
             if self.gui_ref is not None and hasattr(self.gui_ref, "cfg"):
@@ -360,10 +561,26 @@ class MQTTManager:
             })
         return defs
 
-    def publish_discovery(self):
+    def publish_discovery(self, force=False):
+        """
+        Publish the retained discovery configs and schema.  They are built
+        once and hashed; a reconnect republishes only if that hash changed,
+        `force` (HA sent "online") always does.
+        """
         if not self.enable or not self.client:
             return
+        if self._discovery is None:
+            self._discovery = self._build_discovery()
+            self._discovery_hash = hashlib.sha256(
+                json.dumps(self._discovery, sort_keys=True).encode()).hexdigest()
+        if not force and self._discovery_sent == self._discovery_hash:
+            return
+        for topic, payload in self._discovery:
+            self._publish_json(topic, payload, retain=True)
+        self._discovery_sent = self._discovery_hash
 
+    def _build_discovery(self):
+        msgs = []
         device_info = self._device_info()
         for field, conf in self.sensor_definitions.items():
             object_id = f"{self.device_id}_{self._sanitize_id(field).lower()}"
@@ -371,7 +588,7 @@ class MQTTManager:
             payload = {
                 "name": f"{self.entity_prefix_name} {conf['name']}",
                 "state_topic": self.topic_pub,
-                "value_template": conf.get("template") or f"{{{{ value_json.{field} }}}}",
+                "value_template": conf.get("template") or self._value_template(field),
                 "unique_id": object_id,
                 "availability_topic": self.availability_topic,
                 "payload_available": "online",
@@ -395,7 +612,7 @@ class MQTTManager:
                 payload["enabled_by_default"] = bool(conf.get("enabled_by_default"))
             if conf.get("icon"):
                 payload["icon"] = conf.get("icon")
-            self._publish_json(topic, payload, retain=True)
+            msgs.append((topic, payload))
 
         number_topic = f"{self.discovery_prefix}/number/{self.device_id}_setpoint/config"
         number_payload = {
@@ -403,7 +620,7 @@ class MQTTManager:
             "state_topic": self.topic_pub,
             "command_topic": self.setpoint_cmd_topic,
             "command_template": '{"Setpoint": {{ value | float }} }',
-            "value_template": "{{ value_json.Setpoint }}",
+            "value_template": self._value_template("Setpoint"),
             "unit_of_measurement": "°C",
             "min": 0,
             "max": 1200,
@@ -415,13 +632,22 @@ class MQTTManager:
             "payload_not_available": "offline",
             "device": device_info,
         }
-        self._publish_json(number_topic, number_payload, retain=True)
-        self.publish_schema()
+        msgs.append((number_topic, number_payload))
+        msgs.append((self.schema_topic, self._schema_payload()))
+        return msgs
+
+    def _value_template(self, field):
+        if self.delta_mode:             # delta frames may omit the field
+            return (f"{{{{ value_json.{field} if value_json.{field} is defined "
+                    f"else this.state }}}}")
+        return f"{{{{ value_json.{field} }}}}"
 
     def publish_schema(self):
         if not self.enable or not self.client:
             return
+        self._publish_json(self.schema_topic, self._schema_payload(), retain=True)
 
+    def _schema_payload(self):
         fields = {}
         for field, conf in self.sensor_definitions.items():
             fields[field] = {
@@ -442,9 +668,35 @@ class MQTTManager:
             "command_topic": self.setpoint_cmd_topic,
             "availability_topic": self.availability_topic,
             "timestamp_field": "ts",
+            "sequence_field": "sequence",
             "fields": fields,
         }
-        self._publish_json(self.schema_topic, payload, retain=True)
+        if self.history_topic and self.history_batch_size > 1:
+            payload["history"] = {
+                "format": "batch",
+                "columns": list(self.history_columns),
+                "records_field": "records",
+                "max_records": self.history_batch_size,
+                "max_age_sec": self.history_batch_age,
+            }
+        if self.delta_mode:
+            payload["frames"] = {
+                "field": "frame",
+                "key": "all fields, retained",
+                "delta": "fields changed since the previous frame; base_sequence = last key frame",
+                "keyframe_interval": self.keyframe_interval,
+                "keyframe_request_topic": self.keyframe_topic,
+            }
+        if self.binary_topic:
+            payload["binary"] = {
+                "topic": self.binary_topic,
+                "struct": self._binary.format,
+                "size": self._binary.size,
+                "columns": list(self.binary_columns),
+                "layout_id": self._binary_layout,
+                "missing": "NaN",
+            }
+        return payload
 
     def _on_connect(self, client, userdata, flags, reason_code, properties=None):
         rc_value = getattr(reason_code, "value", reason_code)
@@ -454,26 +706,35 @@ class MQTTManager:
             ok = str(reason_code).lower() in {"success", "0"}
 
         if ok:
-            print("[MQTT] connected")
+            self._set_state("connected")
             client.publish(self.availability_topic, "online", qos=self.qos, retain=True)
             client.subscribe(self.setpoint_cmd_topic, qos=self.qos)
             client.subscribe(self.ha_status_topic, qos=self.qos)
+            if self.delta_mode:
+                client.subscribe(self.keyframe_topic, qos=self.qos)
+                self._keyframe_due = True
             self.publish_discovery()
             if self._last_payload:
                 self._publish_json(self.topic_pub, self._last_payload, retain=self.retain)
+            self._start_drain()
         else:
             print(f"[MQTT] connect rc={reason_code}")
+            self._set_state("disconnected")
 
     def _on_message(self, client, userdata, msg):
         raw = msg.payload.decode(errors="replace").strip()
         try:
             if msg.topic == self.ha_status_topic:
                 if raw.lower() == "online":
-                    self.publish_discovery()
+                    self.publish_discovery(force=True)
                     if self._last_payload:
                         self._publish_json(self.topic_pub, self._last_payload, retain=self.retain)
                 return
 
+            if msg.topic == self.keyframe_topic:
+                self._keyframe_due = True
+                return
+
             if msg.topic != self.setpoint_cmd_topic:
                 return
 
@@ -529,33 +790,146 @@ class MQTTManager:
                 return value.isoformat()
         return value
 
-    def _build_payload(self, payload_dict):
-        base = self._clean_json(dict(payload_dict or {}))
-        if "Setpoint" not in base and "SetTemperature" in base:
-            base["Setpoint"] = base.get("SetTemperature")
+    def _compile_payload_plan(self):
+        """
+        Turn sensor_definitions into the fixed parts of every telemetry
+        message: the encoded header up to "sequence", per-key JSON prefixes
+        and the (field, metric key) order of the "metrics" object.
+        """
+        def enc(value):
+            return json.dumps(value, ensure_ascii=False)
 
-        ts_iso, unix_ts = self._utc_now()
-        self._sequence += 1
-        out = {
+        self._header = {
             "schema": self.SCHEMA_NAME,
             "schema_version": self.SCHEMA_VERSION,
             "device_type": self.device_type,
             "device_id": self.device_id,
             "device_name": self.device_name,
-            "sequence": self._sequence,
-            "ts": ts_iso,
-            "unix_time": round(unix_ts, 3),
         }
-        out.update(base)
+        self._header_text = "{" + "".join(f"{enc(k)}:{enc(v)}," for k, v in self._header.items()) + '"sequence":'
+        self._reserved_keys = set(self._header) | {"sequence", "ts", "unix_time", "metrics"}
+        self._key_text = {}
+        self._metric_plan = tuple(
+            (field, conf["metric"], enc(conf["metric"]) + ":")
+            for field, conf in self.sensor_definitions.items() if conf.get("metric")
+        )
+
+    def _encode_value(self, value):
+        """Return (clean value, JSON text); NaN/inf become null."""
+        kind = type(value)
+        if kind is float:
+            return (value, repr(value)) if math.isfinite(value) else (None, "null")
+        if kind is int:
+            return value, str(value)
+        if value is None:
+            return None, "null"
+        if kind is bool:
+            return value, "true" if value else "false"
+        if kind is str:
+            return value, json.dumps(value, ensure_ascii=False)
+        value = self._clean_json(value)
+        return value, json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+    def _build_payload(self, payload_dict, sequence):
+        """One pass over payload_dict -> (payload dict, compact JSON text)."""
+        ts_iso, unix_ts = self._utc_now()
+        unix_ts = round(unix_ts, 3)
+        out = dict(self._header)
+        out["sequence"] = sequence
+        out["ts"] = ts_iso
+        out["unix_time"] = unix_ts
+        parts = [self._header_text, str(sequence), ',"ts":', json.dumps(ts_iso), ',"unix_time":', repr(unix_ts)]
+        encoded = {}
+        key_text = self._key_text
+        for key, value in (payload_dict or {}).items():
+            key = str(key)
+            if key in self._reserved_keys:  # would duplicate a header key
+                return self._build_payload_slow(out, payload_dict)
+            value, text = self._encode_value(value)
+            prefix = key_text.get(key)
+            if prefix is None:
+                prefix = key_text[key] = "," + json.dumps(key, ensure_ascii=False) + ":"
+            out[key] = value
+            encoded[key] = text
+            parts.append(prefix)
+            parts.append(text)
+        if "Setpoint" not in encoded and "SetTemperature" in encoded:
+            out["Setpoint"] = out["SetTemperature"]
+            encoded["Setpoint"] = encoded["SetTemperature"]
+            parts.append(',"Setpoint":')
+            parts.append(encoded["Setpoint"])
 
         metrics = {}
-        for field, conf in self.sensor_definitions.items():
-            metric_name = conf.get("metric")
-            if not metric_name or field not in out:
-                continue
-            metrics[metric_name] = out.get(field)
+        parts.append(',"metrics":{')
+        sep = ""
+        for field, metric, metric_text in self._metric_plan:
+            if field in encoded:
+                metrics[metric] = out[field]
+                parts.append(sep)
+                parts.append(metric_text)
+                parts.append(encoded[field])
+                sep = ","
+        parts.append("}}")
         out["metrics"] = metrics
-        return self._clean_json(out)
+        return out, "".join(parts)
+
+    def _build_payload_slow(self, header, payload_dict):
+        out = dict(header)
+        out.update(self._clean_json(dict(payload_dict)))
+        if "Setpoint" not in out and "SetTemperature" in out:
+            out["Setpoint"] = out.get("SetTemperature")
+        out["metrics"] = {conf["metric"]: out[field]
+                          for field, conf in self.sensor_definitions.items()
+                          if conf.get("metric") and field in out}
+        return out, json.dumps(out, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+    def _delta_frame(self, payload, now):
+        """Return the frame to send for `payload` (itself when keyframe), or None."""
+        fields = {k: v for k, v in payload.items() if k not in self.FRAME_KEYS}
+        metrics = payload.get("metrics", {})
+        if (self._keyframe_due or self._sent_fields is None
+                or now - self._last_keyframe_monotonic >= self.keyframe_interval):
+            self._keyframe_due = False
+            self._last_keyframe_monotonic = now
+            self._key_sequence = payload["sequence"]
+            self._sent_fields, self._sent_metrics = fields, dict(metrics)
+            payload["frame"] = "key"
+            return payload
+
+        missing = object()
+        changed = {k: v for k, v in fields.items() if self._sent_fields.get(k, missing) != v}
+        if not changed:
+            return None
+        changed_metrics = {k: v for k, v in metrics.items() if self._sent_metrics.get(k, missing) != v}
+        self._sent_fields.update(changed)
+        self._sent_metrics.update(changed_metrics)
+        frame = {
+            "schema": self.SCHEMA_NAME,
+            "schema_version": self.SCHEMA_VERSION,
+            "frame": "delta",
+            "device_id": self.device_id,
+            "sequence": payload["sequence"],
+            "base_sequence": self._key_sequence,
+            "ts": payload["ts"],
+            "unix_time": payload["unix_time"],
+        }
+        frame.update(changed)
+        frame["metrics"] = changed_metrics
+        return frame
+
+    def _binary_frame(self, payload):
+        """Pack one sample with the layout announced on the schema topic."""
+        metrics = payload["metrics"]
+        values = []
+        for metric in self.history_metrics:
+            value = metrics.get(metric)
+            values.append(float(value) if isinstance(value, (int, float)) else math.nan)
+        try:
+            return self._binary.pack(self._binary_layout, payload["sequence"] & 0xFFFFFFFF,
+                                     payload["unix_time"], *values)
+        except (struct.error, OverflowError) as e:
+            print(f"[MQTT] binary encode error: {e}")
+            return None
 
     def _publish_json(self, topic, payload, retain=False):
         if not self.enable or not self.client:
@@ -566,26 +940,133 @@ class MQTTManager:
         except Exception as e:
             print(f"[MQTT] publish error on {topic}: {e}")
 
+    def _publish_text(self, topic, text, retain=False):
+        if not self.enable or not self.client:
+            return
+        try:
+            self.client.publish(topic, text, qos=self.qos, retain=bool(retain))
+        except Exception as e:
+            print(f"[MQTT] publish error on {topic}: {e}")
+
+    def _publish_history(self, payload, text=None):
+        """Send a history message, or spool it while offline / a backlog exists."""
+        try:
+            if text is None:
+                text = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+        except ValueError as e:
+            print(f"[MQTT] history encode error: {e}")
+            return
+        if self.spool is None:
+            self._publish_text(self.history_topic, text, retain=False)
+            return
+        if not self.spool and self.client.is_connected():
+            info = self.client.publish(self.history_topic, text, qos=self.qos, retain=False)
+            if info.rc == 0:
+                return
+        self.spool.append(text)         # keeps order behind any backlog
+        if self.client.is_connected():
+            self._start_drain()
+
+    def _start_drain(self):
+        if not self.spool or (self._drain_thread and self._drain_thread.is_alive()):
+            return
+        self._drain_thread = threading.Thread(target=self._drain_spool, daemon=True,
+                                              name="mqtt-spool-drain")
+        self._drain_thread.start()
+
+    def _drain_spool(self):
+        gap = 1.0 / self.spool_drain_rate
+        sent = 0
+        while self.enable and self.client.is_connected():
+            seg = self.spool.take_oldest()
+            if seg is None:
+                break
+            n, lines = seg
+            for i, line in enumerate(lines):
+                if not line.strip():
+                    continue
+                info = self.client.publish(self.history_topic, line, qos=self.qos, retain=False)
+                if info.rc != 0:        # offline again: re-spool what is left, in order
+                    print(f"[MQTT] spool drain paused after {sent} messages")
+                    self.spool.requeue(n, lines[i:])
+                    return
+                sent += 1
+                time.sleep(gap)
+            self.spool.done(n)
+        if sent:
+            print(f"[MQTT] spool drained {sent} messages")
+
     def publish(self, payload_dict, *, force=False):
         if not self.enable or not self.client:
             return
 
         now = time.monotonic()
+        if self._history_batch and now - self._history_batch_started >= self.history_batch_age:
+            self.flush_history()
         if not force and self.publish_interval > 0:
             if now - self._last_publish_monotonic < self.publish_interval:
                 return
         self._last_publish_monotonic = now
 
-        payload = self._build_payload(payload_dict)
+        payload, text = self._build_payload(payload_dict, self._sequence + 1)
+        frame = payload
+        if self.delta_mode:
+            frame = self._delta_frame(payload, now)
+            if frame is None:
+                return                  # nothing changed since the last frame
+            payload["frame"] = "key"    # full state; replayed as a key frame on reconnect
+            text = text[:-1] + ',"frame":"key"}'
+        self._sequence = payload["sequence"]
         self._last_payload = payload
-        self._publish_json(self.topic_pub, payload, retain=self.retain)
+        if frame is payload:
+            self._publish_text(self.topic_pub, text, retain=self.retain)
+        else:
+            self._publish_json(self.topic_pub, frame, retain=False)
+        if self.binary_topic:
+            data = self._binary_frame(payload)
+            if data is not None:
+                self._publish_text(self.binary_topic, data, retain=False)
         if self.history_topic:
-            self._publish_json(self.history_topic, payload, retain=False)
+            self._add_history(payload, frame, text if frame is payload else None, now)
+
+    def _add_history(self, payload, frame, text, now):
+        if self.history_batch_size <= 1:
+            self._publish_history(frame, text)
+            return
+        metrics = payload.get("metrics", {})
+        row = [payload["sequence"], payload["unix_time"]]
+        row.extend(metrics.get(m) for m in self.history_metrics)
+        with self._history_lock:
+            if not self._history_batch:
+                self._history_batch_started = now
+            self._history_batch.append(row)
+            full = len(self._history_batch) >= self.history_batch_size
+        if full:
+            self.flush_history()
+
+    def flush_history(self):
+        """Publish the pending history records as one batch message."""
+        with self._history_lock:
+            records, self._history_batch = self._history_batch, []
+        if not records or not self.history_topic:
+            return
+        self._publish_history({
+            "schema": self.SCHEMA_NAME,
+            "schema_version": self.SCHEMA_VERSION,
+            "format": "batch",
+            "device_type": self.device_type,
+            "device_id": self.device_id,
+            "device_name": self.device_name,
+            "columns": self.history_columns,
+            "count": len(records),
+            "records": records,
+        })
 
     def close(self):
         if not self.client:
             return
         try:
+            self.flush_history()
             self.client.publish(self.availability_topic, "offline", qos=self.qos, retain=True)
             self.client.loop_stop()
             self.client.disconnect()
@@ -598,6 +1079,109 @@ ACCENT_COLOR = "#2E7D32"                    # fresh green accent
 WHITE_BG   = "#FFFFFF"                 # uniform background
 POP_FONT   = ("Arial", max(8, BASE_FONT_SIZE - 7))   # smaller than before
 BTN_FONT = ("Arial", 14)     # ← change 14 to any size you like
+
+# ---- chart render pacing ----
+TARGET_FPS  = cfg.getfloat("UI", "target_fps",  fallback=4.0)
+MAX_BACKOFF = cfg.getfloat("UI", "max_backoff", fallback=8.0)
+
+
+class RenderGovernor:
+    """
+    Paces chart redraws on the Tk main loop.
+
+    Draws at most `target_fps` times per second and only when new data was
+    buffered.  If a draw takes longer than half its frame budget the frame
+    interval is stretched (up to `max_backoff` x) and relaxed again once
+    draws become cheap.  While the window is iconified or unmapped nothing
+    is drawn at all; data keeps buffering and one catch-up draw happens on
+    restore.
+    """
+
+    def __init__(self, master, draw_fn, *, target_fps=4.0, max_backoff=8.0):
+        self.master = master
+        self.draw_fn = draw_fn
+        self.frame_ms = 1000.0 / max(0.1, float(target_fps))
+        self.max_backoff = max(1.0, float(max_backoff))
+        self.backoff = 1.0
+        self.dirty = False
+        self.visible = True
+        self.last_draw_ms = 0.0
+        self._after_id = None
+        self._running = False
+
+        # <Map>/<Unmap> on the toplevel also fire for every child widget
+        master.bind("<Map>",   self._on_map,   add="+")
+        master.bind("<Unmap>", self._on_unmap, add="+")
+
+    def start(self):
+        self._running = True
+        self._schedule(self.frame_ms)
+
+    def stop(self):
+        self._running = False
+        self._cancel()
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    # ------------------------------------------------------------------ #
+    def _interval_ms(self):
+        return int(self.frame_ms * self.backoff)
+
+    def _schedule(self, delay_ms):
+        self._cancel()
+        if self._running:
+            self._after_id = self.master.after(int(delay_ms), self._tick)
+
+    def _cancel(self):
+        if self._after_id is not None:
+            try:
+                self.master.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _window_hidden(self):
+        try:
+            return (not self.visible) or self.master.state() in ("iconic", "withdrawn")
+        except tk.TclError:
+            return True
+
+    def _tick(self):
+        self._after_id = None
+        if self._window_hidden():
+            return                      # resumes from _on_map
+        if self.dirty:
+            self.dirty = False
+            t0 = time.perf_counter()
+            try:
+                self.draw_fn()
+            except Exception as e:
+                print("[UI] chart draw failed:", e)
+            self.last_draw_ms = (time.perf_counter() - t0) * 1000.0
+            self._adapt(self.last_draw_ms)
+        self._schedule(self._interval_ms())
+
+    def _adapt(self, draw_ms):
+        budget = 0.5 * self.frame_ms * self.backoff
+        if draw_ms > budget:
+            self.backoff = min(self.max_backoff, self.backoff * 1.5)
+        elif draw_ms < 0.25 * budget and self.backoff > 1.0:
+            self.backoff = max(1.0, self.backoff / 1.25)
+
+    def _on_map(self, event):
+        if event.widget is not self.master:
+            return
+        self.visible = True
+        self._schedule(0)               # catch up immediately on restore
+
+    def _on_unmap(self, event):
+        if event.widget is not self.master:
+            return
+        self.visible = False
+        self._cancel()
+
+
 class TemperatureControlApp:
     def __init__(self, master):
         self.cfg = cfg
@@ -617,6 +1201,8 @@ class TemperatureControlApp:
         self.running = True
         self.api_thread = None
         self.modbus_thread = None
+        self._ui_after_id = None
+        self._shown = {}                    # last text/value pushed to each widget
         # shared data controls
         self.set_point_var = tk.StringVar()
         self.com_var       = tk.StringVar(value=SERIAL_OPTS["port"])
@@ -627,8 +1213,8 @@ class TemperatureControlApp:
                                                             fallback=os.getcwd()))
 
         # plotting buffers
-        self.times = []
-        self.temps = []
+        self.times = deque()
+        self.temps = deque()
         self.last_plot_ts = datetime.min
         # build the UI
         self._build_layout()
@@ -636,6 +1222,10 @@ class TemperatureControlApp:
         self._build_config_panel()
         self._build_chart_panel()
         self._bind_keys()
+        self.render_gov = RenderGovernor(self.master, self._draw_chart,
+                                         target_fps=TARGET_FPS,
+                                         max_backoff=MAX_BACKOFF)
+        self.render_gov.start()
         self._schedule_ui_refresh()
 
     # ───────────────────────────────────────────────
@@ -729,10 +1319,23 @@ class TemperatureControlApp:
 
 
     def _schedule_ui_refresh(self):
-        self._refresh_readouts()
+        """
+        Single UI dispatcher: drain the acquisition queue, keep only the
+        newest snapshot and apply it.  Runs on the Tk main thread only.
+        """
+        snap = None
+        try:
+            while True:
+                snap = ui_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        if snap is not None:
+            self._refresh_readouts(snap)
+        self._update_mqtt_status()
+
         if self.running:
-            # 100ms later, schedule again on the main thread
-            self.master.after(250, self._schedule_ui_refresh)
+            self._ui_after_id = self.master.after(250, self._schedule_ui_refresh)
 
 
     def _build_layout(self):
@@ -806,11 +1409,17 @@ class TemperatureControlApp:
                 command=self.show_config_dialog)\
         .grid(row=0, column=1, padx=8, pady=4)
 
+        self.mqtt_status = tk.Label(cfg, text="MQTT: off", font=POP_FONT,
+                                    bg=WHITE_BG, fg="#888888")
+        self.mqtt_status.grid(row=1, column=0, columnspan=2, pady=(4, 0))
+
 
     def _build_chart_panel(self):
         self.fig, self.ax = plt.subplots(figsize=(4, 3))
         self.ax.set_xlabel("Time");  self.ax.set_ylabel("Temperature (°C)")
         (self.line,) = self.ax.plot([], [], marker="o", markersize=2, linestyle="-")
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
+        self.ax.tick_params(axis='x', rotation=45)
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.right_frame)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
@@ -979,10 +1588,10 @@ class TemperatureControlApp:
         except Exception as e:
             print("[MQTT] telemetry loop stopped:", e)
 
-    def _refresh_readouts(self):
-            temp  = data_store.get("Temperature")
-            power = data_store.get("Power")
-            spt   = data_store.get("SetTemperature")
+    def _refresh_readouts(self, snap):
+            temp  = snap.get("Temperature")
+            power = snap.get("Power")
+            spt   = snap.get("SetTemperature")
 
             self._update_temp_label(temp)
             self._update_power_display(power)
@@ -991,23 +1600,33 @@ class TemperatureControlApp:
             if temp is not None:
                 self.add_temp_to_plot(temp)
 
+    def _changed(self, key, value):
+        """True (and remember value) if `key` differs from what is shown."""
+        if self._shown.get(key, object()) == value:
+            return False
+        self._shown[key] = value
+        return True
+
     def _update_temp_label(self, temp):
         text = f"{temp:.1f}" if temp is not None else "--"
-        self.temp_label_number.config(text=text)
+        if self._changed("temp", text):
+            self.temp_label_number.config(text=text)
 
     def _update_power_display(self, power):
         if power is not None:
-            p_val = max(0, min(100, power))
-            self.power_bar["value"] = p_val
-            self.power_percent_label.config(text=f"{power:.1f}%")
+            p_val, text = max(0, min(100, power)), f"{power:.1f}%"
         else:
-            self.power_bar["value"] = 0
-            self.power_percent_label.config(text="--%")
+            p_val, text = 0, "--%"
+        if self._changed("power", text):
+            self.power_bar["value"] = p_val
+            self.power_percent_label.config(text=text)
 
     def _update_setpoint_entry(self, spt):
         # only overwrite if user isn’t actively typing
         if not self.entry_typing and spt is not None:
-            self.set_point_var.set(f"{spt:.1f}")
+            text = f"{spt:.1f}"
+            if self.set_point_var.get() != text:
+                self.set_point_var.set(text)
 
     def add_temp_to_plot(self, temp):
         now = datetime.now()
@@ -1021,17 +1640,19 @@ class TemperatureControlApp:
         # keep only last 30 min of data
         cutoff = now - timedelta(minutes=30)
         while self.times and self.times[0] < cutoff:
-            self.times.pop(0); self.temps.pop(0)
+            self.times.popleft(); self.temps.popleft()
+
+        # drawing is paced by the render governor
+        self.render_gov.mark_dirty()
 
-        self.line.set_data(self.times, self.temps)
+    def _draw_chart(self):
+        self.line.set_data(list(self.times), list(self.temps))
         self.ax.relim()                 # update data limits—but…
         if self.toolbar.mode == "":     # …only autoscale when user NOT panning/zooming
             self.ax.autoscale_view()    # preserves manual zoom until Home is pressed
 
-        self.ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
-        self.ax.tick_params(axis='x', rotation=45)
         self.fig.tight_layout()
-        self.canvas.draw_idle()
+        self.canvas.draw()              # synchronous so the governor can time it
 
 
 
@@ -1060,13 +1681,36 @@ class TemperatureControlApp:
             publish_interval = self.cfg.getfloat("MQTT", "publish_interval_sec", fallback=1.0),
             expire_after = self.cfg.getint("MQTT", "expire_after", fallback=300),
             history_topic = self.cfg["MQTT"].get("history_topic", ""),
+            delta_mode = self.cfg.getboolean("MQTT", "delta_mode", fallback=False),
+            keyframe_interval = self.cfg.getfloat("MQTT", "keyframe_interval_sec", fallback=60.0),
+            history_batch_size = self.cfg.getint("MQTT", "history_batch_size", fallback=60),
+            history_batch_age = self.cfg.getfloat("MQTT", "history_batch_age_sec", fallback=60.0),
+            spool_dir = self.cfg.get("MQTT", "spool_dir", fallback="")
+                        or os.path.join(os.path.dirname(os.path.abspath(__file__)), "mqtt_spool"),
+            spool_max_bytes = int(self.cfg.getfloat("MQTT", "spool_max_mb", fallback=50) * 1024 * 1024),
+            spool_drain_rate = self.cfg.getfloat("MQTT", "spool_drain_rate", fallback=20.0),
+            binary_topic = self.cfg["MQTT"].get("binary_topic", ""),
+            reconnect_min = self.cfg.getfloat("MQTT", "reconnect_min_s", fallback=1),
+            reconnect_max = self.cfg.getfloat("MQTT", "reconnect_max_s", fallback=60),
             gui_ref = self
         )
 
+    MQTT_STATE_COLORS = {"connected": ACCENT_COLOR, "connecting": "#E6A100",
+                         "disconnected": "#C62828"}
+
+    def _update_mqtt_status(self):
+        """Mirror mqtt_mgr.state (set on the paho thread) in the status label."""
+        mgr = self.mqtt_mgr
+        state = mgr.state if mgr and mgr.enable else "off"
+        if self.mqtt_status.cget("text") != f"MQTT: {state}":
+            self.mqtt_status.config(text=f"MQTT: {state}",
+                                    fg=self.MQTT_STATE_COLORS.get(state, "#888888"))
+
     # called by MQTTManager when a remote user changes the set-point in HA
+    # (runs on the paho thread, so the entry is updated via the UI queue)
     def apply_remote_setpoint(self, new_sv):
         data_store["SetTemperature"] = new_sv
-        self.set_point_var.set(f"{new_sv:.1f}")
+        post_ui_snapshot()
         threading.Thread(
             target=write_register,
             args=(client, 3000, new_sv),
@@ -1078,8 +1722,9 @@ class TemperatureControlApp:
         global stop_threads
         stop_threads = True
         self.running = False
-        try: self.master.after_cancel(self._schedule_ui_refresh)  # no stray after
+        try: self.master.after_cancel(self._ui_after_id)  # no stray after
         except Exception: pass
+        self.render_gov.stop()
         if client:
             client.close()
         if self.mqtt_mgr:
@@ -0,0 +1,101 @@
+"""
+Microbenchmark: per-publish cost of the LongHistory telemetry payload.
+
+    python bench_mqtt_payload.py [iterations]
+
+Compares the previous builder (clean -> merge -> metrics -> clean again ->
+json.dumps) with the compiled plan used by MQTTManager._build_payload now.
+MQTTManager is loaded straight from TempControl_MQTT_LongHistory.py source,
+since importing that script would start Tk, Flask and Modbus.
+"""
+import ast
+import json
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from timeit import Timer
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TempControl_MQTT_LongHistory.py")
+
+SAMPLE = {
+    "Temperature": 853.4, "Power": 41.2, "Setpoint": 850.0, "SetTemperature": 850.0,
+    "PowerLimit": None, "Segment": 3, "SegmentLeft": 12.5,
+    "P": 12.0, "I": 240.0, "D": 60.0, "Cycle": 2.0, "Correction": 0.0,
+    "Filter": 1.0, "OvertempAlarm": float("nan"), "ManualOverride": False,
+}
+
+
+def load_manager():
+    with open(SCRIPT, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), SCRIPT)
+    nodes = [n for n in tree.body if isinstance(n, ast.ClassDef) and n.name == "MQTTManager"]
+    ns = {"json": json, "math": math, "os": os, "threading": threading, "time": time,
+          "datetime": datetime, "timezone": timezone}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), SCRIPT, "exec"), ns)
+    cls = ns["MQTTManager"]
+
+    mgr = cls.__new__(cls)            # no broker: only the payload path is exercised
+    mgr.gui_ref = None
+    mgr.device_type = "onway"
+    mgr.device_id = "Onway_TempCtl"
+    mgr.device_name = "Onway Temperature Controller"
+    mgr.sensor_definitions = mgr._sensor_definitions()
+    mgr._compile_payload_plan()
+    fixed = mgr._utc_now()
+    mgr._utc_now = lambda: fixed      # identical timestamps for the comparison
+    return mgr
+
+
+def legacy_publish(mgr, payload_dict, sequence):
+    """The builder as it was before the compiled plan, plus json.dumps."""
+    base = mgr._clean_json(dict(payload_dict or {}))
+    if "Setpoint" not in base and "SetTemperature" in base:
+        base["Setpoint"] = base.get("SetTemperature")
+    ts_iso, unix_ts = mgr._utc_now()
+    out = {
+        "schema": mgr.SCHEMA_NAME,
+        "schema_version": mgr.SCHEMA_VERSION,
+        "device_type": mgr.device_type,
+        "device_id": mgr.device_id,
+        "device_name": mgr.device_name,
+        "sequence": sequence,
+        "ts": ts_iso,
+        "unix_time": round(unix_ts, 3),
+    }
+    out.update(base)
+    metrics = {}
+    for field, conf in mgr.sensor_definitions.items():
+        metric_name = conf.get("metric")
+        if not metric_name or field not in out:
+            continue
+        metrics[metric_name] = out.get(field)
+    out["metrics"] = metrics
+    out = mgr._clean_json(out)
+    return out, json.dumps(out, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    mgr = load_manager()
+
+    for sample in (SAMPLE, {"Temperature": 20.5, "Power": 0.0, "SetTemperature": 25}):
+        old_obj, old_text = legacy_publish(mgr, sample, 7)
+        new_obj, new_text = mgr._build_payload(sample, 7)
+        assert old_text == new_text, (old_text, new_text)
+        assert old_obj == new_obj
+
+    results = {}
+    for name, fn in (("legacy", lambda: legacy_publish(mgr, SAMPLE, 7)),
+                     ("compiled", lambda: mgr._build_payload(SAMPLE, 7))):
+        best = min(Timer(fn).repeat(repeat=5, number=n)) / n
+        results[name] = best
+        print(f"{name:>9}: {best * 1e6:7.2f} µs/publish")
+    print(f"  speedup: {results['legacy'] / results['compiled']:.2f}x  "
+          f"({len(mgr._build_payload(SAMPLE, 7)[1])} bytes, identical output)")
+
+
+if __name__ == "__main__":
+    main()
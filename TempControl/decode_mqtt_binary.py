@@ -0,0 +1,98 @@
+"""
+Decoder for the packed telemetry MQTTManager sends on `binary_topic`.
+
+    python decode_mqtt_binary.py HOST STATE_TOPIC [--port 1883] [--csv]
+
+Reads the retained STATE_TOPIC/schema message for the frame layout, then
+subscribes to the binary topic named there and prints one line per frame.
+load_layout() / decode_frame() can be imported to unpack frames that were
+stored elsewhere (the layout only needs the schema's "binary" block).
+"""
+import argparse
+import json
+import math
+import struct
+import sys
+
+
+def load_layout(schema):
+    """Return (Struct, columns, layout_id) from a schema message (dict or JSON)."""
+    if isinstance(schema, (bytes, str)):
+        schema = json.loads(schema)
+    binary = schema.get("binary")
+    if not binary:
+        raise ValueError("schema has no 'binary' block (binary_topic not configured)")
+    return struct.Struct(binary["struct"]), tuple(binary["columns"]), int(binary["layout_id"])
+
+
+def decode_frame(layout, data):
+    """Unpack one frame into {column: value}; NaN metrics come back as None."""
+    fmt, columns, layout_id = layout
+    if len(data) != fmt.size:
+        raise ValueError(f"frame is {len(data)} bytes, layout expects {fmt.size}")
+    values = fmt.unpack(data)
+    if values[0] != layout_id:
+        raise ValueError(f"layout id {values[0]} != {layout_id}; schema changed?")
+    return {col: (None if isinstance(v, float) and math.isnan(v) else v)
+            for col, v in zip(columns[1:], values[1:])}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("host")
+    ap.add_argument("topic", help="telemetry state topic (its /schema is read)")
+    ap.add_argument("--port", type=int, default=1883)
+    ap.add_argument("--username", default="")
+    ap.add_argument("--password", default="")
+    ap.add_argument("--csv", action="store_true", help="print CSV rows instead of JSON")
+    args = ap.parse_args()
+
+    import paho.mqtt.client as mqtt
+
+    schema_topic = f"{args.topic.rstrip('/')}/schema"
+    state = {"layout": None, "topic": None}
+
+    def on_connect(client, userdata, flags, rc, properties=None):
+        client.subscribe(schema_topic)
+
+    def on_message(client, userdata, msg):
+        if msg.topic == schema_topic:
+            try:
+                layout = load_layout(msg.payload)
+            except (ValueError, KeyError) as e:
+                print(f"[decode] {e}", file=sys.stderr)
+                return
+            topic = json.loads(msg.payload)["binary"]["topic"]
+            if state["topic"] and state["topic"] != topic:
+                client.unsubscribe(state["topic"])
+            state["layout"], state["topic"] = layout, topic
+            client.subscribe(topic)
+            if args.csv:
+                print(",".join(layout[1][1:]), flush=True)
+            return
+        if state["layout"] is None or msg.topic != state["topic"]:
+            return
+        try:
+            row = decode_frame(state["layout"], msg.payload)
+        except (ValueError, struct.error) as e:
+            print(f"[decode] {e}", file=sys.stderr)
+            return
+        if args.csv:
+            print(",".join("" if v is None else str(v) for v in row.values()), flush=True)
+        else:
+            print(json.dumps(row), flush=True)
+
+    client = mqtt.Client()
+    if args.username:
+        client.username_pw_set(args.username, args.password or None)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.host, args.port, keepalive=60)
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()